@@ -0,0 +1,130 @@
+import collections
+import json
+import logging
+import math
+import os
+import threading
+from metrics import ADAPTIVE_TIMEOUT
+
+
+class AdaptiveTimeouts:
+    """
+    Process-wide wait timeouts derived from recently observed wait latencies.
+
+    Each named wait keeps a rolling window of how long it took. Once enough samples are in, its
+    timeout is the window's p99 times FACTOR, clamped to [MIN_TIMEOUT, MAX_TIMEOUT] and never more
+    than MAX_GROWTH times the previous timeout; until then the caller's default applies. A wait that
+    times out is recorded as a censored sample: it only shows the wait needs more than the timeout it
+    had. When the p99 falls on a censored sample, or after FALLBACK_AFTER consecutive timeouts, the
+    learned value is no upper bound and the caller's default applies again until successful waits
+    say otherwise. Windows are saved to a JSON file so a restarted worker starts from what the
+    previous one learned.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(AdaptiveTimeouts, cls).__new__(cls)
+            return cls._instance
+
+    def __init__(self):
+        if hasattr(self, 'initialized') and self.initialized:
+            return
+
+        self.enabled = os.getenv("ADAPTIVE_TIMEOUTS", "true").lower() == "true"
+        self.path = os.getenv("ADAPTIVE_TIMEOUTS_PATH", "data/wait_latencies.json")
+        self.window = int(os.getenv("ADAPTIVE_TIMEOUT_WINDOW", 200))
+        self.min_samples = int(os.getenv("ADAPTIVE_TIMEOUT_MIN_SAMPLES", 20))
+        self.factor = float(os.getenv("ADAPTIVE_TIMEOUT_FACTOR", 3))
+        self.min_timeout = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", 5))
+        self.max_timeout = float(os.getenv("ADAPTIVE_TIMEOUT_MAX", 120))
+        self.save_every = int(os.getenv("ADAPTIVE_TIMEOUT_SAVE_EVERY", 25))
+        self.fallback_after = int(os.getenv("ADAPTIVE_TIMEOUT_FALLBACK_AFTER", 2))
+        self.max_growth = float(os.getenv("ADAPTIVE_TIMEOUT_MAX_GROWTH", 1.5))
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.window))
+        self._timeouts = collections.Counter()
+        self._current = {}
+        self._unsaved = 0
+        self._load()
+        self.initialized = True
+
+    def timeout(self, name, default):
+        """Seconds to allow the named wait; `default` until enough samples have been observed."""
+        if not self.enabled:
+            return default
+        with self._lock:
+            samples = sorted(self._samples[name])
+            if len(samples) < self.min_samples:
+                return default
+            p99, censored = samples[math.ceil(0.99 * len(samples)) - 1]
+            if censored or self._timeouts[name] >= self.fallback_after:
+                # Waits are taking longer than anything the window can vouch for.
+                timeout = default
+            else:
+                timeout = min(p99 * self.factor, self._current.get(name, default) * self.max_growth)
+                timeout = min(self.max_timeout, max(self.min_timeout, timeout))
+            self._current[name] = timeout
+        ADAPTIVE_TIMEOUT.labels(wait=name).set(timeout)
+        return timeout
+
+    def observe(self, name, seconds):
+        """Record how long a wait that succeeded took."""
+        with self._lock:
+            self._timeouts.pop(name, None)
+        self._record(name, seconds, False)
+
+    def observe_timeout(self, name, timeout):
+        """Record that a wait gave up after `timeout` seconds without its condition becoming true."""
+        with self._lock:
+            self._timeouts[name] += 1
+        self._record(name, timeout, True)
+
+    def _record(self, name, seconds, censored):
+        with self._lock:
+            self._samples[name].append((round(seconds, 3), censored))
+            self._unsaved += 1
+            save = self._unsaved >= self.save_every
+        if save:
+            self.save()
+
+    def save(self):
+        # Serialized so two workers reaching save_every together never write the same temporary file.
+        with self._save_lock:
+            with self._lock:
+                data = {name: [list(sample) for sample in samples] for name, samples in self._samples.items()}
+                self._unsaved = 0
+            self._write(data)
+
+    def _write(self, data):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(data, file)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logging.warning(f"Failed to save wait latencies to {self.path}: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable wait latencies in {self.path}: {e}")
+            return
+        for name, samples in data.items():
+            # Files written before timeouts were recorded hold bare latencies.
+            self._samples[name].extend(
+                (float(sample), False) if isinstance(sample, (int, float)) else (float(sample[0]), bool(sample[1]))
+                for sample in samples)
+        logging.info(f"Loaded wait latencies for {len(data)} waits from {self.path}.")
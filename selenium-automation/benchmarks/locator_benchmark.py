@@ -0,0 +1,60 @@
+"""
+Measure the lookup cost of every registered locator strategy against saved Microsoft page snapshots.
+
+Each snapshot in --snapshots is loaded from disk into Chrome, then every strategy (ID, CSS, XPath) of
+every locator in locators.LOCATORS is timed over --repeat find_elements calls. Save new snapshots
+from a live session with driver.page_source when Microsoft changes its pages.
+
+Usage (from selenium-automation/): python benchmarks/locator_benchmark.py [--repeat 50] [--mode headless]
+"""
+import argparse
+import os
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_manager import DriverManager  # noqa: E402
+from locators import LOCATORS  # noqa: E402
+
+
+def time_strategy(driver, by, value, repeat):
+    samples = []
+    matches = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        matches = len(driver.find_elements(by, value))
+        samples.append((time.perf_counter() - started) * 1000)
+    return matches, statistics.mean(samples), statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshots", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--mode", choices=["headless", "headful"], default="headless")
+    args = parser.parse_args()
+
+    driver_manager = DriverManager(mode=args.mode)
+    driver = driver_manager.driver
+    print(f"{'snapshot':<24} {'locator':<32} {'strategy':<16} {'matches':>7} {'mean ms':>9} {'p50 ms':>9}")
+    try:
+        for snapshot in sorted(pathlib.Path(args.snapshots).glob("*.html")):
+            driver.get(snapshot.resolve().as_uri())
+            for locator in LOCATORS.values():
+                results = [(by, *time_strategy(driver, by, value, args.repeat))
+                           for by, value in locator.strategies]
+                # Only report locators that belong on this page.
+                if not any(matches for _, matches, _, _ in results):
+                    continue
+                for by, matches, mean, median in results:
+                    print(f"{snapshot.stem:<24} {locator.name:<32} {by:<16} {matches:>7} {mean:>9.2f} {median:>9.2f}")
+    finally:
+        driver_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Offline stand-in for the AuthN API endpoints the worker calls.
+
+  GET   /internal/tap/<userId>/<issuerId>   returns a Temporary Access Pass
+  PATCH /internal/azureAutoOBR               accepts a status update (requestId, userId query params)
+  PATCH /internal/azureAutoOBR/bulk          accepts a list of status updates
+  POST  /internal/createCredential           returns a fake credential for makeCredential.js
+
+Run the worker with AUTHNAPI_URL=http://127.0.0.1:<port>, AUTHNAPI_OBR_PATH=/internal/createCredential
+and, for bulk status updates, AUTHNAPI_BULK_STATUS_PATH=/internal/azureAutoOBR/bulk.
+
+Usage: python benchmarks/mock_authn_api.py [--port 8081] [--latency-ms 50] [--jitter-ms 20]
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+
+class MockAuthnHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "MockAuthnAPI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        latency = self.server.latency_ms + random.uniform(-1, 1) * self.server.jitter_ms
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def _cors_headers(self):
+        # makeCredential.js calls this API from the Microsoft page's origin.
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, PATCH, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, x-api-key")
+
+    def _send_json(self, data, status=200):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self._cors_headers()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _count(self, counter, amount=1):
+        with self.server.lock:
+            self.server.counters[counter] = self.server.counters.get(counter, 0) + amount
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._cors_headers()
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._delay()
+        parts = urllib.parse.urlparse(self.path).path.strip("/").split("/")
+        if len(parts) == 4 and parts[:2] == ["internal", "tap"]:
+            self._count("tap")
+            self._send_json({"temporaryAccessPass": f"TAP-{os.urandom(6).hex()}"})
+        else:
+            self._send_json({"message": "Not found"}, status=404)
+
+    def do_PATCH(self):
+        self._delay()
+        url = urllib.parse.urlparse(self.path)
+        if url.path == "/internal/azureAutoOBR":
+            query = urllib.parse.parse_qs(url.query)
+            body = self._body() or {}
+            if not query.get("requestId") or not query.get("userId") or "status" not in body:
+                self._send_json({"message": "requestId, userId and status are required"}, status=400)
+                return
+            self._count("status")
+            self._count(f"status_{body['status']}")
+            self._send_json({"updated": 1})
+        elif url.path == "/internal/azureAutoOBR/bulk":
+            updates = self._body() or []
+            self._count("status", len(updates))
+            for update in updates:
+                self._count(f"status_{update.get('status')}")
+            self._send_json({"updated": len(updates)})
+        else:
+            self._send_json({"message": "Not found"}, status=404)
+
+    def do_POST(self):
+        self._delay()
+        if urllib.parse.urlparse(self.path).path != "/internal/createCredential":
+            self._send_json({"message": "Not found"}, status=404)
+            return
+        request = self._body() or {}
+        self._count("credential")
+        credential_id = os.urandom(32).hex()
+        self._send_json({
+            "id": credential_id,
+            "rawId": credential_id,
+            "type": "public-key",
+            "response": {
+                "attestationObject": os.urandom(64).hex(),
+                "clientDataJSON": {
+                    "type": "webauthn.create",
+                    "challenge": request.get("publicKey", {}).get("challenge", ""),
+                    "origin": request.get("origin", ""),
+                },
+            },
+        })
+
+
+def start(port=0, latency_ms=0, jitter_ms=0):
+    """Start the stand-in on a background thread and return the server; server.counters tallies calls."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MockAuthnHandler)
+    server.daemon_threads = True
+    server.latency_ms = latency_ms
+    server.jitter_ms = jitter_ms
+    server.lock = threading.Lock()
+    server.counters = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the AuthN API.")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Mean delay added to every request.")
+    parser.add_argument("--jitter-ms", type=int, default=0, help="Random +/- variation of the request delay.")
+    args = parser.parse_args()
+    server = start(args.port, args.latency_ms, args.jitter_ms)
+    print(f"Mock AuthN API serving on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
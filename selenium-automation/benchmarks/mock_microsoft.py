@@ -0,0 +1,253 @@
+"""
+Offline stand-in for the mysignins.microsoft.com/security-info flow driven by MicrosoftSignIn.
+
+It serves the same sequence of pages: email, Temporary Access Pass, "Stay signed in?", the
+security-info page with its add-method, security-key, USB, key-name dialogs, and a registration page
+that calls navigator.credentials.create. Element markup matches locators.LOCATORS. Point the worker
+at it with MS_SECURITY_INFO_URL=http://127.0.0.1:<port>/security-info.
+
+Error scenarios are chosen by the user's email prefix:
+  moreinfo...   "Your organization needs more information" page after sign-in
+  keylimit...   10 security keys limit banner instead of the USB device button
+  twofactor...  two-factor authentication required message instead of the USB device button
+  badtap...     access pass validation error logged to the browser console
+
+Usage: python benchmarks/mock_microsoft.py [--port 8443] [--latency-ms 200] [--jitter-ms 100] [--ui-delay-ms 300]
+"""
+import argparse
+import http.cookies
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title></head>
+<body>
+{body}
+</body></html>
+"""
+
+EMAIL_PAGE = """
+<div class="row text-title" role="heading" aria-level="1">Sign in</div>
+<form method="post" action="/login/email">
+  <input type="email" name="loginfmt" id="i0116" class="form-control ltr_override input ext-input text-box ext-text-box">
+  <input type="submit" id="idSIButton9" class="win-button button_primary button ext-button primary ext-primary" value="Next">
+</form>
+"""
+
+ACCESS_PASS_PAGE = """
+<div class="row text-title" role="heading" aria-level="1">Enter Temporary Access Pass</div>
+<form method="post" action="/login/accesspass">
+  <input type="password" name="accesspass" id="accesspass" class="form-control input ext-input text-box ext-text-box">
+  <input type="submit" id="idSIButton9" class="win-button button_primary button ext-button primary ext-primary" value="Sign in">
+</form>
+"""
+
+STAY_SIGNED_IN_PAGE = """
+<div class="row text-title" role="heading" aria-level="1">Stay signed in?</div>
+<form method="post" action="/login/kmsi">
+  <input type="button" id="idBtn_Back" class="win-button button-secondary button ext-button secondary ext-secondary" value="No">
+  <input type="submit" id="idSIButton9" class="win-button button_primary button ext-button primary ext-primary" value="Yes">
+</form>
+"""
+
+MORE_INFORMATION_PAGE = """
+<div class="row text-title" role="heading" aria-level="1">More information required</div>
+<div id="ProofUpDescription">Your organization needs more information to keep your account secure</div>
+"""
+
+SECURITY_INFO_PAGE = """
+<div id="root">
+  <h2>Security info</h2>
+  <div id="status"></div>
+  <button type="button" name="Add method" class="ms-Button ms-Button--action ms-Button--command" onclick="openAddMethod()">
+    <span class="ms-Button-flexContainer"><span class="ms-Button-label">Add sign-in method</span></span>
+  </button>
+  <div id="dialog"></div>
+</div>
+<script>
+const scenario = {scenario};
+const uiDelay = {ui_delay_ms};
+if (scenario === "badtap") {{
+  console.error("AADSTS50000: An access pass could not be found or verified for the user.");
+}}
+function render(html) {{
+  setTimeout(() => {{ document.getElementById("dialog").innerHTML = html; }}, uiDelay);
+}}
+function button(label, onclick, primary) {{
+  const kind = primary ? "ms-Button--primary" : "ms-Button--default";
+  return `<button type="button" class="ms-Button ${{kind}}" onclick="${{onclick}}">` +
+         `<span class="ms-Button-flexContainer"><span class="ms-Button-label">${{label}}</span></span></button>`;
+}}
+function openAddMethod() {{
+  render(`<div role="dialog"><div>Add a method</div>
+    <div role="combobox" aria-label="Authentication method options" tabindex="0" onclick="openOptions()">Choose a method</div>
+    <div id="options"></div>
+    ${{button("Add", "addMethod()", true)}}</div>`);
+}}
+function openOptions() {{
+  document.getElementById("options").innerHTML =
+    `<button type="button" role="option"><span class="ms-Button-flexContainer"><span>Authenticator app</span></span></button>` +
+    `<button type="button" role="option" onclick="window.selectedMethod='key'"><span class="ms-Button-flexContainer"><span>Security key</span></span></button>`;
+}}
+function addMethod() {{
+  if (window.selectedMethod !== "key") return;
+  if (scenario === "keylimit") {{
+    render(`<div id="ms-banner">You have already reached the limit of 10 security keys.</div>`);
+  }} else if (scenario === "twofactor") {{
+    render(`<div>To set up a security key, you need to sign in with two-factor authentication.</div>`);
+  }} else {{
+    render(`<div role="dialog"><div>Security key</div>${{button("USB device", "keyReady()")}}${{button("NFC device", "")}}</div>`);
+  }}
+}}
+function keyReady() {{
+  render(`<div role="dialog"><div>Have your key ready</div>${{button("Next", "nameKey()", true)}}</div>`);
+}}
+function nameKey() {{
+  render(`<div role="dialog"><div>Name your security key</div>
+    <input id="TextField12" type="text" maxlength="30">
+    ${{button("Next", "registerKey()", true)}}</div>`);
+}}
+function registerKey() {{
+  const name = document.getElementById("TextField12").value;
+  window.location.href = "/security-info/register?name=" + encodeURIComponent(name);
+}}
+</script>
+"""
+
+REGISTER_PAGE = """
+<div id="status">Registering security key...</div>
+<script>
+(async () => {
+  const status = document.getElementById("status");
+  try {
+    const credential = await navigator.credentials.create({ publicKey: {
+      challenge: crypto.getRandomValues(new Uint8Array(32)),
+      rp: { name: "Microsoft" },
+      user: { id: crypto.getRandomValues(new Uint8Array(16)), name: "user", displayName: "user" },
+      pubKeyCredParams: [{ type: "public-key", alg: -7 }],
+    }});
+    if (!credential) throw new Error("no credential");
+    await fetch("/api/keys", { method: "POST", body: JSON.stringify({ id: credential.id }) });
+    status.textContent = "Security key registered";
+  } catch (error) {
+    console.error("Security key registration failed: " + error);
+    status.textContent = "Security key registration failed";
+  }
+})();
+</script>
+"""
+
+
+class MockMicrosoftHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "MockMicrosoft/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        latency = self.server.latency_ms + random.uniform(-1, 1) * self.server.jitter_ms
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def _cookies(self):
+        return http.cookies.SimpleCookie(self.headers.get("Cookie", ""))
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return urllib.parse.parse_qs(self.rfile.read(length).decode())
+
+    def _send_page(self, title, body, cookies=None):
+        content = PAGE.format(title=title, body=body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (cookies or {}).items():
+            self.send_header("Set-Cookie", f"{name}={value}; Path=/")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _redirect(self, location, cookies=None):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        for name, value in (cookies or {}).items():
+            self.send_header("Set-Cookie", f"{name}={value}; Path=/")
+        self.end_headers()
+
+    def _scenario(self):
+        email = urllib.parse.unquote(self._cookies().get("mock_user", http.cookies.Morsel()).value or "")
+        for scenario in ("moreinfo", "keylimit", "twofactor", "badtap"):
+            if email.startswith(scenario):
+                return scenario
+        return "ok"
+
+    def do_GET(self):
+        self._delay()
+        path = urllib.parse.urlparse(self.path).path
+        signed_in = "mock_auth" in self._cookies()
+        if path == "/security-info" and not signed_in:
+            self._redirect("/login")
+        elif path == "/security-info":
+            self._send_page("My Sign-Ins | Security Info", SECURITY_INFO_PAGE.format(
+                scenario=json.dumps(self._scenario()), ui_delay_ms=self.server.ui_delay_ms))
+        elif path == "/security-info/register":
+            self._send_page("My Sign-Ins | Security Info", REGISTER_PAGE)
+        elif path == "/login":
+            self._send_page("Sign in to your account", EMAIL_PAGE)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        self._delay()
+        path = urllib.parse.urlparse(self.path).path
+        if path == "/login/email":
+            email = self._form().get("loginfmt", [""])[0]
+            self._send_page("Sign in to your account", ACCESS_PASS_PAGE,
+                            cookies={"mock_user": urllib.parse.quote(email)})
+        elif path == "/login/accesspass":
+            if not self._form().get("accesspass", [""])[0]:
+                self._send_page("Sign in to your account", ACCESS_PASS_PAGE)
+            elif self._scenario() == "moreinfo":
+                self._send_page("Sign in to your account", MORE_INFORMATION_PAGE)
+            else:
+                self._send_page("Sign in to your account", STAY_SIGNED_IN_PAGE)
+        elif path == "/login/kmsi":
+            self._redirect("/security-info", cookies={"mock_auth": "1"})
+        elif path == "/api/keys":
+            self._form()
+            with self.server.lock:
+                self.server.keys_registered += 1
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+
+def start(port=0, latency_ms=0, jitter_ms=0, ui_delay_ms=0):
+    """Start the stand-in on a background thread and return the server; server.server_port is the bound port."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MockMicrosoftHandler)
+    server.daemon_threads = True
+    server.latency_ms = latency_ms
+    server.jitter_ms = jitter_ms
+    server.ui_delay_ms = ui_delay_ms
+    server.lock = threading.Lock()
+    server.keys_registered = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Microsoft security-info flow.")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Mean delay added to every request.")
+    parser.add_argument("--jitter-ms", type=int, default=0, help="Random +/- variation of the request delay.")
+    parser.add_argument("--ui-delay-ms", type=int, default=0, help="Delay before each dialog renders.")
+    args = parser.parse_args()
+    server = start(args.port, args.latency_ms, args.jitter_ms, args.ui_delay_ms)
+    print(f"Mock Microsoft sign-in serving on http://127.0.0.1:{server.server_port}/security-info")
+    threading.Event().wait()
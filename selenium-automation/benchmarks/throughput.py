@@ -0,0 +1,196 @@
+"""
+End-to-end throughput of the worker against the offline Microsoft and AuthN API stand-ins.
+
+Both stand-ins are started in-process, the worker is pointed at them through its environment
+variables, and --users synthetic users are provisioned through MainApp.process_message for each
+worker count in --workers. Status updates go through a StatusReporter with a throwaway outbox.
+Reported per run: users/minute, p50/p95 per-user latency, and peak RSS of this process plus
+every Chrome/ChromeDriver process it started.
+
+Usage (from selenium-automation/):
+  python benchmarks/throughput.py --users 20 --workers 1 2 4 [--pool-size 4] [--backend lite] [--shared-browser]
+      [--latency-ms 150] [--jitter-ms 50] [--ui-delay-ms 200] [--failure-scenarios keylimit twofactor]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import mock_authn_api  # noqa: E402
+import mock_microsoft  # noqa: E402
+
+
+def rss_bytes(root_pid):
+    """Resident memory of root_pid and all of its descendants, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces; fields after it are fixed.
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, pending = 0, [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RSSSampler:
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.peak = max(self.peak, rss_bytes(os.getpid()))
+            self._stopped.wait(self.interval)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(app, users, workers):
+    """Provision users with `workers` threads; return (elapsed seconds, latencies, statuses, peak RSS)."""
+    from main import MainApp
+
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    original_report_status = MainApp._report_status
+
+    def report_status(self, user_id, requestId, status, detail):
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+        original_report_status(self, user_id, requestId, status, detail)
+
+    def provision(message):
+        started = time.perf_counter()
+        try:
+            app.process_message(message, retries_exhausted=True)
+        except Exception:
+            pass
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    app._report_status = report_status.__get__(app)
+    with RSSSampler() as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="browser-worker") as executor:
+            list(executor.map(provision, users))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, statuses, sampler.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pool-size", type=int, default=0,
+                        help="Reuse Chrome sessions from a DriverPool of this size. 0 launches a browser per user.")
+    parser.add_argument("--pool-max-uses", type=int, default=50)
+    parser.add_argument("--mode", choices=["headless", "headful"], default="headless")
+    parser.add_argument("--backend", choices=["chrome", "lite"], default="chrome")
+    parser.add_argument("--shared-browser", action="store_true",
+                        help="Run every user in a browser context of one shared Chrome process.")
+    parser.add_argument("--latency-ms", type=int, default=100, help="Mean delay of every stand-in response.")
+    parser.add_argument("--jitter-ms", type=int, default=50, help="Random +/- variation of the delay.")
+    parser.add_argument("--ui-delay-ms", type=int, default=200, help="Delay before each Microsoft dialog renders.")
+    parser.add_argument("--failure-scenarios", nargs="*", default=[],
+                        choices=["moreinfo", "keylimit", "twofactor"],
+                        help="Error scenarios mixed into the users round-robin with successful ones.")
+    args = parser.parse_args()
+
+    microsoft = mock_microsoft.start(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, ui_delay_ms=args.ui_delay_ms)
+    authn = mock_authn_api.start(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    outbox = tempfile.TemporaryDirectory()
+    # Set before the worker modules are imported: several of them read configuration at import time.
+    os.environ.update({
+        "MS_SECURITY_INFO_URL": f"http://127.0.0.1:{microsoft.server_port}/security-info",
+        "AUTHNAPI_URL": f"http://127.0.0.1:{authn.server_port}",
+        "AUTHNAPI_OBR_PATH": "/internal/createCredential",
+        "AUTHNAPI_BULK_STATUS_PATH": "/internal/azureAutoOBR/bulk",
+        "PASSKEY_OBR_API_KEY": os.environ.get("PASSKEY_OBR_API_KEY", "benchmark"),
+        "STATUS_OUTBOX_PATH": os.path.join(outbox.name, "status_outbox.sqlite3"),
+    })
+
+    import metrics
+    from driver_manager import DriverPool, SharedBrowser
+    from main import MainApp
+    from status_reporter import StatusReporter
+
+    scenarios = [""] + args.failure_scenarios
+    print(f"{'workers':>7} {'users':>6} {'users/min':>10} {'p50 s':>8} {'p95 s':>8} {'peak RSS MB':>12}  statuses")
+    for workers in args.workers:
+        app = MainApp()
+        app.mode = args.mode
+        app.workers = workers
+        app.backend = args.backend
+        app.status_reporter = StatusReporter(app.azure_auto_obr_client, poll_interval=1)
+        app.status_reporter.start()
+        if args.shared_browser:
+            app.shared_browsers[args.backend] = SharedBrowser(mode=args.mode, backend=args.backend)
+        if args.pool_size > 0:
+            driver_pool = DriverPool(size=args.pool_size, max_uses=args.pool_max_uses,
+                                     mode=args.mode, backend=args.backend,
+                                     shared_browser=app.shared_browsers.get(args.backend))
+            metrics.register_driver_pool(driver_pool)
+            driver_pool.start()
+            app.driver_pools[args.backend] = driver_pool
+        users = [{
+            "email": f"{scenarios[i % len(scenarios)]}user{i}@benchmark.test",
+            "userId": uuid.uuid4().hex,
+            "issuerId": "benchmark",
+            "requestId": uuid.uuid4().hex,
+        } for i in range(args.users)]
+        try:
+            elapsed, latencies, statuses, peak_rss = run(app, users, workers)
+        finally:
+            app.status_reporter.stop()
+            for driver_pool in app.driver_pools.values():
+                driver_pool.close()
+            for shared_browser in app.shared_browsers.values():
+                shared_browser.close()
+        print(f"{workers:>7} {len(users):>6} {len(users) / elapsed * 60:>10.1f} "
+              f"{statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f} "
+              f"{peak_rss / 2 ** 20:>12.0f}  {statuses}")
+    print(f"AuthN API calls: {authn.counters}; keys registered on the Microsoft stand-in: {microsoft.keys_registered}")
+    outbox.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import logging
+import threading
+import trio
+from contextlib import asynccontextmanager
+from selenium.webdriver.common.bidi import cdp
+from selenium.webdriver.remote.bidi_connection import BidiConnection
+
+
+class ConsoleErrorMonitor:
+    """
+    Watches the page console through a CDP event stream and remembers the first error signature seen.
+
+    Runtime.consoleAPICalled and Log.entryAdded events are matched as they arrive on a background
+    thread; check() raises the matching exception on the caller's thread. If the CDP connection
+    cannot be opened, check() falls back to scanning driver.get_log('browser').
+    """
+
+    def __init__(self, driver, signatures, connect_timeout=5, target_id=None):
+        """
+        :param signatures: (compiled pattern, exception class) pairs, checked in order
+        :param target_id: DevTools target to watch; defaults to the first target of the session's browser
+        """
+        self.driver = driver
+        self.signatures = signatures
+        self.connect_timeout = connect_timeout
+        self.target_id = target_id
+        self.streaming = False
+        self.matched = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="console-monitor", daemon=True)
+        self._thread.start()
+        self._ready.wait(self.connect_timeout)
+        if not self.streaming:
+            logging.warning(
+                "CDP console streaming unavailable, falling back to polling browser logs.")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(self.connect_timeout)
+
+    def check(self):
+        """Raise the exception for the first error signature seen so far, if any."""
+        if not self.streaming:
+            for entry in self.driver.get_log('browser'):
+                self._match(entry.get("message", ""))
+        self.raise_if_matched()
+
+    def raise_if_matched(self):
+        """Like check(), but never touches the browser; cheap enough to call on every wait poll."""
+        if self.matched:
+            exception_class, text = self.matched
+            raise exception_class(f"Error detected in browser console: {text}")
+
+    def _match(self, text):
+        if self.matched or not text:
+            return
+        for pattern, exception_class in self.signatures:
+            if pattern.search(text):
+                self.matched = (exception_class, text)
+                return
+
+    def _run(self):
+        try:
+            trio.run(self._listen)
+        except Exception as e:
+            logging.debug(f"Console monitor stopped: {e!r}")
+        finally:
+            self.streaming = False
+            self._ready.set()
+
+    @asynccontextmanager
+    async def _target_connection(self):
+        # Like driver.bidi_connection(), but attached to our own page in a browser shared with other sessions.
+        version, websocket_url = self.driver._get_cdp_details()
+        devtools = cdp.import_devtools(version)
+        async with cdp.open_cdp(websocket_url) as connection:
+            async with connection.open_session(devtools.target.TargetID(self.target_id)) as session:
+                yield BidiConnection(session, cdp, devtools)
+
+    async def _listen(self):
+        connection_context = self._target_connection() if self.target_id else self.driver.bidi_connection()
+        async with connection_context as connection:
+            session, devtools = connection.session, connection.devtools
+            await session.execute(devtools.runtime.enable())
+            await session.execute(devtools.log.enable())
+            self.streaming = True
+            self._ready.set()
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(self._consume_console_calls, session, devtools)
+                nursery.start_soon(self._consume_log_entries, session, devtools)
+                while not self._stopped.is_set():
+                    await trio.sleep(0.2)
+                nursery.cancel_scope.cancel()
+
+    async def _consume_console_calls(self, session, devtools):
+        async for event in session.listen(devtools.runtime.ConsoleAPICalled):
+            self._match(" ".join(
+                str(arg.value if arg.value is not None else arg.description or "") for arg in event.args))
+
+    async def _consume_log_entries(self, session, devtools):
+        async for event in session.listen(devtools.log.EntryAdded):
+            self._match(event.entry.text)
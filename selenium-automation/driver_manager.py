@@ -1,35 +1,484 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import trio
+import trio_websocket
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+from metrics import DRIVER_STARTUP
+
+# "chrome" is the full desktop profile; "lite" is a trimmed profile for tenants whose flow is stable.
+BACKENDS = ("chrome", "lite")
+DEFAULT_BACKEND = os.getenv("DRIVER_BACKEND", "chrome")
+
+# URL patterns for Network.setBlockedURLs, grouped so each backend's policy can name what it does without.
+BLOCKED_URL_GROUPS = {
+    "images": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+               "*aadcdn.msftauthimages.net*"],
+    "media": ["*.mp4", "*.webm", "*.mp3"],
+    "fonts": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "telemetry": ["*google-analytics.com*", "*googletagmanager.com*", "*clarity.ms*",
+                  "*browser.events.data.microsoft.com*", "*mobile.events.data.microsoft.com*",
+                  "*js.monitor.azure.com*", "*dc.services.visualstudio.com*"],
+}
+NETWORK_POLICIES = {
+    "chrome": os.getenv("CHROME_BLOCK_RESOURCES", "telemetry"),
+    "lite": os.getenv("LITE_BLOCK_RESOURCES", "images,media,fonts,telemetry"),
+}
+EXTRA_BLOCKED_URLS = [url for url in os.getenv("EXTRA_BLOCKED_URLS", "").split(",") if url]
+DISK_CACHE_SIZE = int(os.getenv("DRIVER_DISK_CACHE_SIZE", 100 * 1024 * 1024))
+
+
+def blocked_urls(backend):
+    groups = [group for group in NETWORK_POLICIES.get(backend, "").split(",") if group]
+    return [url for group in groups for url in BLOCKED_URL_GROUPS[group]] + EXTRA_BLOCKED_URLS
+
+
+def chrome_arguments(mode, backend, disk_cache_dir=None):
+    arguments = [
+        "--no-sandbox",
+        "--disable-gpu",
+        "--disable-dev-shm-usage",
+        "--disable-extensions",
+    ]
+    if backend == "lite":
+        # A single renderer with a capped JS heap and no images, background services or disk cache.
+        arguments += [
+            "--window-size=1280,800",
+            "--blink-settings=imagesEnabled=false",
+            "--renderer-process-limit=1",
+            "--js-flags=--max-old-space-size=256",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-sync",
+            "--mute-audio",
+        ]
+    else:
+        arguments.append('--window-size=1920x1080')
+    if disk_cache_dir:
+        # Static portal assets survive across the users, and restarts, of one pool slot.
+        arguments += [f"--disk-cache-dir={disk_cache_dir}", f"--disk-cache-size={DISK_CACHE_SIZE}"]
+    elif backend == "lite":
+        arguments.append("--disk-cache-size=1")
+    if mode == "headless":
+        arguments.append("--headless")
+    # Console errors are streamed over CDP, so verbose Chrome logging is only needed for debugging.
+    if os.getenv("CHROME_VERBOSE_LOGGING", "false").lower() == "true":
+        arguments += ["--enable-logging", "--v=1"]
+    return arguments
 
 
 class DriverManager:
     """Manages the Selenium driver setup and operations."""
 
-    def __init__(self, mode="headless"):
+    # Origins whose cookies and storage must not leak between users sharing a session.
+    RESET_ORIGINS = [
+        "https://login.microsoftonline.com",
+        "https://login.live.com",
+        "https://mysignins.microsoft.com",
+    ]
+
+    # Network events are read back from ChromeDriver's performance log to measure bytes per user.
+    MEASURE_NETWORK = os.getenv("MEASURE_NETWORK_USAGE", "true").lower() == "true"
+
+    def __init__(self, mode="headless", backend=DEFAULT_BACKEND, disk_cache_dir=None):
         self.mode = mode
-        self.driver = self.setup_driver()
+        self.backend = backend
+        self.disk_cache_dir = disk_cache_dir
+        self.blocked_urls = blocked_urls(backend)
+        self.cache_slot = None
+        self.uses = 0
+        self.injected_scripts = []
+        # DevTools target of the page, when it is not simply the session's first one.
+        self.target_id = None
+        with DRIVER_STARTUP.time():
+            self.driver = self.setup_driver()
 
     def setup_driver(self):
         options = webdriver.ChromeOptions()
-        options.add_argument("--incognito")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-extensions")
-        options.add_argument('--window-size=1920x1080')
-        if self.mode == "headless":
-            options.add_argument("--headless")
-
+        if not self.disk_cache_dir:
+            # Incognito keeps the HTTP cache in memory, so it is only used without a disk cache.
+            options.add_argument("--incognito")
+        for argument in chrome_arguments(self.mode, self.backend, self.disk_cache_dir):
+            options.add_argument(argument)
         options.page_load_strategy = 'eager'
-
-        options.add_argument("--enable-logging")
-        options.add_argument("--v=1")
+        self._enable_performance_log(options)
         caps = DesiredCapabilities.CHROME
 
         driver = webdriver.Chrome(service=ChromeService(
             executable_path="./chromedriver", desired_capabilities=caps), options=options)
+        self._block_urls(driver)
         return driver
 
+    def _enable_performance_log(self, options):
+        if self.MEASURE_NETWORK:
+            options.set_capability("goog:loggingPrefs", {"browser": "ALL", "performance": "ALL"})
+            options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+
+    def _block_urls(self, driver):
+        if self.blocked_urls:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_urls})
+
+    def network_usage(self):
+        """
+        Network activity since the last call, read from the performance log.
+
+        :return: (bytes received, requests finished, requests blocked), or None when not measured
+        """
+        if not self.MEASURE_NETWORK:
+            return None
+        received = finished = blocked = 0
+        for entry in self.driver.get_log("performance"):
+            event = json.loads(entry["message"])["message"]
+            if event["method"] == "Network.loadingFinished":
+                finished += 1
+                received += event["params"].get("encodedDataLength", 0)
+            elif event["method"] == "Network.loadingFailed" and event["params"].get("blockedReason"):
+                blocked += 1
+        return received, finished, blocked
+
+    def execute_cdp_cmd(self, cmd: str, params: dict = None):
+        return self.driver.execute_cdp_cmd(cmd, params or {})
+
+    def add_script_on_new_document(self, source: str):
+        """Register a script on every new document and remember it so reset() can remove it."""
+        result = self.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument", {"source": source})
+        if result and result.get("identifier"):
+            self.injected_scripts.append(result["identifier"])
+        return result
+
+    def is_alive(self):
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def reset(self):
+        """Return the session to a clean state so it can be handed to the next user."""
+        for identifier in self.injected_scripts:
+            self.execute_cdp_cmd(
+                "Page.removeScriptToEvaluateOnNewDocument", {"identifier": identifier})
+        self.injected_scripts = []
+        self.driver.get("about:blank")
+        self.execute_cdp_cmd("Network.clearBrowserCookies")
+        for origin in self.RESET_ORIGINS:
+            self.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": origin, "storageTypes": "all"})
+        for handle in self.driver.window_handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(self.driver.window_handles[0])
+        # Drop the previous user's network events so the next measurement starts clean.
+        self.network_usage()
+
     def close(self):
         self.driver.quit()
+
+
+class SharedBrowser:
+    """
+    One Chrome process, started with a remote debugging port, hosting an isolated browser context per user.
+
+    ContextDriverManager sessions attach to it through ChromeDriver's debuggerAddress. Browser contexts
+    are created and disposed over the browser-level DevTools connection. The process is started by the
+    first session and restarted by ensure_started() if it has died.
+    """
+
+    STARTUP_TIMEOUT = 30
+
+    def __init__(self, mode="headless", backend=DEFAULT_BACKEND):
+        self.mode = mode
+        self.backend = backend
+        self.binary = os.getenv("CHROME_BINARY", "google-chrome")
+        self.process = None
+        self.address = None
+        self.contexts = 0
+        self._websocket_url = None
+        self._user_data_dir = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._user_data_dir = tempfile.mkdtemp(prefix="shared-chrome-")
+        self.process = subprocess.Popen(
+            [self.binary, *chrome_arguments(self.mode, self.backend),
+             "--remote-debugging-port=0", f"--user-data-dir={self._user_data_dir}",
+             "--no-first-run", "about:blank"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Chrome writes the port it picked and the browser endpoint path once DevTools is listening.
+        port_file = os.path.join(self._user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        while True:
+            lines = []
+            if os.path.exists(port_file):
+                with open(port_file) as file:
+                    lines = file.read().split()
+            if len(lines) == 2:
+                break
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.close()
+                raise WebDriverException("Shared Chrome did not start its DevTools endpoint.")
+            time.sleep(0.1)
+        self.address = f"127.0.0.1:{lines[0]}"
+        self._websocket_url = f"ws://{self.address}{lines[1]}"
+        self.contexts = 0
+        logging.info(f"Shared {self.backend} Chrome started, DevTools on {self.address}.")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ensure_started(self):
+        """Start the browser, or restart it if it has exited, so that `address` is current."""
+        with self._lock:
+            if not self.is_alive():
+                if self.process:
+                    logging.warning(f"Shared {self.backend} Chrome exited, restarting it.")
+                    self.close()
+                self.start()
+
+    def create_context(self):
+        """Create a browser context with one blank page and return (browser context id, target id)."""
+        self.ensure_started()
+        context_id = self.send("Target.createBrowserContext")["browserContextId"]
+        target_id = self.send("Target.createTarget", {
+            "url": "about:blank", "browserContextId": context_id})["targetId"]
+        with self._lock:
+            self.contexts += 1
+        return context_id, target_id
+
+    def dispose_context(self, context_id):
+        """Close every page of the context and drop its cookies, storage and cache."""
+        try:
+            self.send("Target.disposeBrowserContext", {"browserContextId": context_id})
+        finally:
+            with self._lock:
+                # Contexts of a browser that was restarted are already gone from the count.
+                self.contexts = max(0, self.contexts - 1)
+
+    def send(self, method, params=None):
+        """Send a browser-level DevTools command and return its result."""
+        try:
+            reply = trio.run(self._send, method, params or {})
+        except Exception as e:
+            raise WebDriverException(f"{method} failed: {e!r}")
+        if "error" in reply:
+            raise WebDriverException(f"{method} failed: {reply['error'].get('message')}")
+        return reply.get("result", {})
+
+    async def _send(self, method, params):
+        async with trio_websocket.open_websocket_url(self._websocket_url) as websocket:
+            await websocket.send_message(json.dumps({"id": 1, "method": method, "params": params}))
+            while True:
+                reply = json.loads(await websocket.get_message())
+                if reply.get("id") == 1:
+                    return reply
+
+    def close(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self._user_data_dir:
+            shutil.rmtree(self._user_data_dir, ignore_errors=True)
+        self.address = self._websocket_url = self._user_data_dir = None
+
+
+class ContextDriverManager(DriverManager):
+    """
+    A ChromeDriver session attached to a SharedBrowser and working in a browser context of its own.
+
+    Contexts share no cookies, storage or cache, so reset() replaces the context instead of clearing it
+    and close() disposes it without touching the shared browser or other users' contexts.
+    """
+
+    def __init__(self, shared_browser, mode="headless", backend=DEFAULT_BACKEND):
+        self.shared_browser = shared_browser
+        self.browser_context_id = None
+        # The ChromeDriver session attaches to the browser's address, so it must be running first.
+        shared_browser.ensure_started()
+        super().__init__(mode=mode, backend=backend)
+        self._open_context()
+
+    def setup_driver(self):
+        options = webdriver.ChromeOptions()
+        options.debugger_address = self.shared_browser.address
+        options.page_load_strategy = 'eager'
+        self._enable_performance_log(options)
+        return webdriver.Chrome(service=ChromeService(
+            executable_path="./chromedriver"), options=options)
+
+    def reset(self):
+        """Replace the browser context; nothing the previous user left behind survives its disposal."""
+        self._close_context()
+        self.injected_scripts = []
+        self._open_context()
+        self.network_usage()
+
+    def close(self):
+        try:
+            self._close_context()
+        finally:
+            self.driver.quit()
+
+    def _open_context(self):
+        self.browser_context_id, self.target_id = self.shared_browser.create_context()
+        handle = WebDriverWait(self.driver, 10).until(lambda driver: self._window_handle())
+        self.driver.switch_to.window(handle)
+        self._block_urls(self.driver)
+
+    def _window_handle(self):
+        # ChromeDriver names windows after their DevTools target ("CDwindow-" prefixed in older releases).
+        for handle in self.driver.window_handles:
+            if handle.endswith(self.target_id):
+                return handle
+        return None
+
+    def _close_context(self):
+        if self.browser_context_id:
+            context_id, self.browser_context_id = self.browser_context_id, None
+            self.shared_browser.dispose_context(context_id)
+
+
+class DriverPool:
+    """Keeps a number of pre-launched Chrome sessions and hands them out one user at a time."""
+
+    def __init__(self, size=2, max_uses=50, mode="headless", backend=DEFAULT_BACKEND, shared_browser=None,
+                 disk_cache_dir=None):
+        """
+        :param disk_cache_dir: Root of the per-slot disk caches; each of the `size` slots keeps its own
+            cache directory, used by one Chrome at a time and inherited by the Chrome that replaces it
+        """
+        self.size = size
+        self.max_uses = max_uses
+        self.mode = mode
+        self.backend = backend
+        self.shared_browser = shared_browser
+        self.disk_cache_dir = disk_cache_dir
+        self._idle = queue.Queue()
+        self._cache_slots = queue.Queue()
+        if disk_cache_dir and not shared_browser:
+            for slot in range(size):
+                self._cache_slots.put(slot)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "recycled": 0,
+            "reset_failures": 0,
+            "reset_time_total": 0.0,
+            "resets": 0,
+        }
+
+    def start(self):
+        for _ in range(self.size):
+            self._idle.put(self._new_driver())
+        logging.info(f"Driver pool started with {self.size} {self.backend} sessions.")
+
+    def acquire(self):
+        while True:
+            try:
+                driver_manager = self._idle.get_nowait()
+            except queue.Empty:
+                self._count("misses")
+                return self._new_driver()
+            if driver_manager.is_alive():
+                self._count("hits")
+                return driver_manager
+            self._discard(driver_manager)
+
+    def release(self, driver_manager, healthy=True):
+        driver_manager.uses += 1
+        if self._closed or not healthy or driver_manager.uses >= self.max_uses:
+            self._discard(driver_manager)
+            self._refill()
+            return
+
+        started = time.monotonic()
+        try:
+            driver_manager.reset()
+        except WebDriverException as e:
+            logging.warning(f"Failed to reset pooled driver, recycling it: {e}")
+            self._count("reset_failures")
+            self._discard(driver_manager)
+            self._refill()
+            return
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stats["resets"] += 1
+            self.stats["reset_time_total"] += elapsed
+
+        if self._idle.qsize() < self.size:
+            self._idle.put(driver_manager)
+        else:
+            self._discard(driver_manager, recycled=False)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["idle"] = self._idle.qsize()
+        stats["reset_time_avg"] = (
+            stats["reset_time_total"] / stats["resets"] if stats["resets"] else 0.0)
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait(), recycled=False)
+            except queue.Empty:
+                break
+
+    def _new_driver(self):
+        if self.shared_browser:
+            return ContextDriverManager(self.shared_browser, mode=self.mode, backend=self.backend)
+        try:
+            slot = self._cache_slots.get_nowait()
+        except queue.Empty:
+            # No cache configured, or every slot is in use by a live session: start with a private cache.
+            return DriverManager(mode=self.mode, backend=self.backend)
+        try:
+            driver_manager = DriverManager(
+                mode=self.mode, backend=self.backend,
+                disk_cache_dir=os.path.join(self.disk_cache_dir, f"{self.backend}-{slot}"))
+        except Exception:
+            self._cache_slots.put(slot)
+            raise
+        driver_manager.cache_slot = slot
+        return driver_manager
+
+    def _refill(self):
+        if self._closed or self._idle.qsize() >= self.size:
+            return
+        try:
+            self._idle.put(self._new_driver())
+        except WebDriverException as e:
+            logging.error(f"Failed to launch replacement pooled driver: {e}")
+
+    def _discard(self, driver_manager, recycled=True):
+        if recycled:
+            self._count("recycled")
+        try:
+            driver_manager.close()
+        except Exception:
+            pass
+        if driver_manager.cache_slot is not None:
+            self._cache_slots.put(driver_manager.cache_slot)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
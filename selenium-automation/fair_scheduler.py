@@ -0,0 +1,100 @@
+import collections
+import threading
+
+
+def parse_issuer_settings(value, cast=int):
+    """Parse "issuer=value,issuer=value" configuration into a dict."""
+    settings = {}
+    for entry in (value or "").split(","):
+        if "=" in entry:
+            issuer, setting = entry.rsplit("=", 1)
+            settings[issuer.strip()] = cast(setting)
+    return settings
+
+
+class FairScheduler:
+    """
+    Hands buffered deliveries to the browser workers fairly across issuers.
+
+    Deliveries are queued per issuer and dispatched in weighted round-robin order: an issuer with
+    weight 3 gets up to three dispatches for every one of an issuer with weight 1. An issuer that
+    has reached its concurrency cap is passed over until one of its users finishes, so a single
+    large request cannot occupy every worker while other issuers wait.
+    """
+
+    def __init__(self, slots, dispatch, weights=None, caps=None, default_cap=0):
+        """
+        :param slots: Number of deliveries that may be in progress at once
+        :param dispatch: Called with (issuer, item) outside the scheduler lock for every dispatched item
+        :param weights: Issuer -> round-robin weight; issuers not listed have weight 1
+        :param caps: Issuer -> maximum deliveries in progress; others use default_cap, 0 meaning no cap
+        """
+        self.slots = slots
+        self.dispatch = dispatch
+        self.weights = weights or {}
+        self.caps = caps or {}
+        self.default_cap = default_cap
+        self._pending = {}
+        self._order = collections.deque()
+        self._credits = {}
+        self._running = collections.Counter()
+        self._lock = threading.Lock()
+
+    def submit(self, issuer, item):
+        with self._lock:
+            if issuer not in self._pending:
+                self._pending[issuer] = collections.deque()
+                self._order.append(issuer)
+            self._pending[issuer].append(item)
+            ready = self._take_ready()
+        self._dispatch_all(ready)
+
+    def done(self, issuer):
+        """Free the slot of a finished delivery and dispatch whatever may run now."""
+        with self._lock:
+            self._running[issuer] -= 1
+            if self._running[issuer] <= 0:
+                del self._running[issuer]
+            ready = self._take_ready()
+        self._dispatch_all(ready)
+
+    def buffered(self):
+        with self._lock:
+            return sum(len(items) for items in self._pending.values())
+
+    def _dispatch_all(self, ready):
+        for issuer, item in ready:
+            self.dispatch(issuer, item)
+
+    def _take_ready(self):
+        ready = []
+        while sum(self._running.values()) < self.slots:
+            issuer = self._next_issuer()
+            if issuer is None:
+                break
+            ready.append((issuer, self._pending[issuer].popleft()))
+            self._running[issuer] += 1
+            if not self._pending[issuer]:
+                del self._pending[issuer]
+                self._order.remove(issuer)
+                self._credits.pop(issuer, None)
+        return ready
+
+    def _next_issuer(self):
+        for _ in range(len(self._order)):
+            issuer = self._order[0]
+            cap = self.caps.get(issuer, self.default_cap)
+            if cap and self._running[issuer] >= cap:
+                self._rotate()
+                continue
+            credits = self._credits.get(issuer) or self.weights.get(issuer, 1)
+            if credits > 1:
+                self._credits[issuer] = credits - 1
+            else:
+                self._rotate()
+            return issuer
+        return None
+
+    def _rotate(self):
+        self._credits.pop(self._order[0], None)
+        self._order.rotate(-1)
@@ -0,0 +1,94 @@
+import time
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+from locators import FALLBACK_AFTER
+
+
+class Detector:
+    """
+    Recognises one possible outcome of a page state.
+
+    :param name: Outcome name returned by FlowEngine.resolve()
+    :param locator: Locator of the element that identifies the outcome
+    :param clickable: Require the element to be displayed and enabled, not just present
+    :param text: Only match if the element's text contains this string
+    :param error: Exception class raised when this outcome is detected
+    :param message: Message for the raised error; defaults to the element's text
+    """
+
+    def __init__(self, name, locator, clickable=False, text=None, error=None, message=None):
+        self.name = name
+        self.locator = locator
+        self.clickable = clickable
+        self.text = text
+        self.error = error
+        self.message = message
+
+    def match(self, driver, fallback=True):
+        for element in self.locator.find_all(driver, fallback=fallback):
+            try:
+                if self.clickable and not (element.is_displayed() and element.is_enabled()):
+                    continue
+                if self.text and self.text not in element.text:
+                    continue
+                return element
+            except StaleElementReferenceException:
+                continue
+        return None
+
+
+class PageState:
+    """A point in the flow where any of several detectors may resolve, in priority order."""
+
+    def __init__(self, name, detectors, timeout):
+        self.name = name
+        self.detectors = detectors
+        self.timeout = timeout
+
+
+class FlowEngine:
+    """Resolves page states with a single wait over all of their detectors."""
+
+    def __init__(self, driver, poll_frequency=0.5, error_check=None, timeouts=None):
+        """
+        :param timeouts: AdaptiveTimeouts that set and learn each state's timeout; state.timeout is used without it
+        """
+        self.driver = driver
+        self.poll_frequency = poll_frequency
+        self.error_check = error_check
+        self.timeouts = timeouts
+
+    def resolve(self, state):
+        """
+        Wait until one of the state's detectors matches.
+
+        :return: (detector name, element) of the first detector to match
+        :raises: The detector's error if an error outcome matched, TimeoutException if none did
+        """
+        def any_detector(driver):
+            if self.error_check:
+                self.error_check()
+            # Fallback selectors are only tried once the fast ones have had FALLBACK_AFTER seconds.
+            fallback = time.monotonic() - started >= FALLBACK_AFTER
+            for detector in state.detectors:
+                element = detector.match(driver, fallback=fallback)
+                if element is not None:
+                    return detector, element
+            return False
+
+        timeout = self.timeouts.timeout(state.name, state.timeout) if self.timeouts else state.timeout
+        started = time.monotonic()
+        try:
+            detector, element = WebDriverWait(
+                self.driver, timeout, poll_frequency=self.poll_frequency).until(any_detector)
+        except TimeoutException:
+            if self.timeouts:
+                self.timeouts.observe_timeout(state.name, timeout)
+            expected = ", ".join(detector.name for detector in state.detectors)
+            raise TimeoutException(
+                f"None of [{expected}] appeared in state '{state.name}' within {timeout:.1f} seconds.")
+        if self.timeouts:
+            self.timeouts.observe(state.name, time.monotonic() - started)
+        if detector.error:
+            raise detector.error(detector.message or element.text or detector.name)
+        return detector.name, element
@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+import time
+import httpx
+
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class HttpClient:
+    """Process-wide HTTP client with keep-alive pooling and retry with backoff."""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(HttpClient, cls).__new__(cls)
+            return cls._instance
+
+    def __init__(self):
+        if hasattr(self, 'initialized') and self.initialized:
+            return
+
+        self.retries = int(os.getenv("HTTP_RETRIES", 3))
+        self.backoff = float(os.getenv("HTTP_BACKOFF", 0.5))
+        timeout = httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", 30)),
+                                connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)))
+        limits = httpx.Limits(max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 20)),
+                              max_keepalive_connections=int(
+                                  os.getenv("HTTP_MAX_KEEPALIVE", 10)),
+                              keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60)))
+        http2 = os.getenv("HTTP2", "false").lower() == "true"
+        try:
+            self.transport = httpx.HTTPTransport(http2=http2, limits=limits)
+        except ImportError:
+            logging.warning(
+                "HTTP/2 requested but the 'h2' package is not installed; falling back to HTTP/1.1.")
+            self.transport = httpx.HTTPTransport(limits=limits)
+        self.client = httpx.Client(transport=self.transport, timeout=timeout)
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.attempt_count = 0
+        self.retry_count = 0
+        self.failure_count = 0
+        self.initialized = True
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request on the shared client, retrying transport errors and 502/503/504 responses.
+
+        :return: The last response received; raises the last transport error if none was received
+        """
+        delay = self.backoff
+        with self._lock:
+            self.request_count += 1
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self.attempt_count += 1
+            try:
+                response = self.client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                logging.warning(
+                    f"{method} {url} returned {response.status_code}, retrying in {delay} seconds...")
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    with self._lock:
+                        self.failure_count += 1
+                    raise
+                logging.warning(
+                    f"{method} {url} failed ({e!r}), retrying in {delay} seconds...")
+            with self._lock:
+                self.retry_count += 1
+            time.sleep(delay)
+            delay *= 2
+
+    def metrics(self):
+        return {
+            "requests": self.request_count,
+            "attempts": self.attempt_count,
+            "retries": self.retry_count,
+            "failures": self.failure_count,
+        }
+
+    def close(self):
+        self.client.close()
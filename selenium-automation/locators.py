@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.common.by import By
+
+POLL_FREQUENCY = float(os.getenv("LOCATOR_POLL_FREQUENCY", 0.25))
+# Seconds a wait polls the fast selector alone before it also tries the fallbacks.
+FALLBACK_AFTER = float(os.getenv("LOCATOR_FALLBACK_AFTER", 3))
+
+
+class Locator:
+    """
+    An element on a Microsoft page, located by a fast ID/CSS selector with an XPath fallback.
+
+    Waits poll the fast selector alone for their first FALLBACK_AFTER seconds, so an element that
+    has not appeared yet costs one WebDriver round trip per poll. After that the fallbacks are tried
+    too; if one matches while the fast selector does not (Microsoft changed its markup), the
+    locator logs once and switches to it for every worker. Targets that can only be identified by
+    their text have no CSS form and use XPath alone.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name, css=None, xpath=None, element_id=None):
+        self.name = name
+        self.strategies = []
+        if element_id:
+            self.strategies.append((By.ID, element_id))
+        if css:
+            self.strategies.append((By.CSS_SELECTOR, css))
+        if xpath:
+            self.strategies.append((By.XPATH, xpath))
+
+    def find_all(self, driver, fallback=True):
+        """
+        :param fallback: Also try the fallback strategies when the fast one finds nothing
+        """
+        strategies = self.strategies
+        for index, (by, value) in enumerate(strategies if fallback else strategies[:1]):
+            elements = driver.find_elements(by, value)
+            if elements:
+                if index > 0:
+                    self._demote_fast_path(strategies[index])
+                return elements
+        return []
+
+    def present(self):
+        """Expected condition: the first matching element, or False."""
+        started = time.monotonic()
+
+        def condition(driver):
+            elements = self.find_all(driver, fallback=time.monotonic() - started >= FALLBACK_AFTER)
+            return elements[0] if elements else False
+        return condition
+
+    def clickable(self):
+        """Expected condition: the first displayed and enabled matching element, or False."""
+        started = time.monotonic()
+
+        def condition(driver):
+            for element in self.find_all(driver, fallback=time.monotonic() - started >= FALLBACK_AFTER):
+                try:
+                    if element.is_displayed() and element.is_enabled():
+                        return element
+                except StaleElementReferenceException:
+                    continue
+            return False
+        return condition
+
+    def _demote_fast_path(self, strategy):
+        # LOCATORS is shared by every browser worker; only the first to see the change reorders it.
+        with self._lock:
+            index = self.strategies.index(strategy)
+            if index == 0:
+                return
+            logging.warning(
+                f"Locator '{self.name}' fell back to {strategy[0]}; "
+                f"{self.strategies[:index]} no longer match.")
+            self.strategies = self.strategies[index:] + self.strategies[:index]
+
+
+# Every element MicrosoftSignIn interacts with or probes for.
+LOCATORS = {locator.name: locator for locator in [
+    Locator("email_input",
+            css="input[type='email'][name='loginfmt']",
+            xpath="//input[@type='email' and @name='loginfmt']"),
+    Locator("email_next_button",
+            css="input[type='submit'][value='Next'].button_primary",
+            xpath="//input[@type='submit' and @value='Next' and contains(@class, 'button_primary')]"),
+    Locator("access_pass_input",
+            css="input[name='accesspass']",
+            xpath="//input[@name='accesspass']"),
+    Locator("sign_in_button",
+            css="input[type='submit'][value='Sign in'].button_primary",
+            xpath="//input[@type='submit' and @value='Sign in' and contains(@class, 'button_primary')]"),
+    Locator("stay_signed_in_yes_button",
+            css="input#idSIButton9[type='submit'][value='Yes']",
+            xpath="//input[@type='submit' and @id='idSIButton9' and @value='Yes']"),
+    Locator("more_information_description",
+            element_id="ProofUpDescription",
+            xpath="//*[@id='ProofUpDescription']"),
+    Locator("add_method_button",
+            css="[name='Add method']",
+            xpath="//*[@name='Add method']"),
+    Locator("method_dropdown",
+            css="div[role='combobox'][aria-label='Authentication method options']",
+            xpath="//div[@role='combobox' and @aria-label='Authentication method options']"),
+    Locator("security_key_option",
+            xpath="//span[contains(@class, 'ms-Button-flexContainer') and .//span[text()='Security key']]"),
+    Locator("add_button",
+            xpath="//button[@type='button' and .//span[text()='Add']]"),
+    Locator("usb_device_button",
+            xpath="//button[@type='button' and .//span[text()='USB device']]"),
+    Locator("key_limit_banner",
+            element_id="ms-banner",
+            xpath="//*[@id='ms-banner']"),
+    Locator("two_factor_required_message",
+            xpath="//div[contains(text(), 'To set up a security key, you need to sign in with two-factor authentication.')]"),
+    Locator("add_security_key_next_button",
+            xpath="//button[contains(@class, 'ms-Button--primary') and .//span[text()='Next']]"),
+    Locator("security_key_name_input",
+            css="[id*='TextField']",
+            xpath="//*[contains(@id, 'TextField')]"),
+    Locator("final_next_button",
+            xpath="//button[@type='button' and contains(@class, 'ms-Button') and contains(@class, 'ms-Button--primary') and .//span[text()='Next']]"),
+]}
@@ -1,4 +1,11 @@
+import base64
+import collections
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import threading
 import time
 import os
 
@@ -20,6 +27,132 @@ class ColoredFormatter(logging.Formatter):
 
 class LogConfig:
     LOG_LEVEL = logging.INFO  # Set the desired log level here
+    # off | on-failure | sampled | always
+    SCREENSHOT_POLICY = os.getenv("SCREENSHOT_POLICY", "on-failure")
+    SCREENSHOT_SAMPLE_RATE = float(os.getenv("SCREENSHOT_SAMPLE_RATE", 0.01))
+    SCREENSHOT_BUFFER_SIZE = int(os.getenv("SCREENSHOT_BUFFER_SIZE", 6))
+    SCREENSHOT_JPEG_QUALITY = int(os.getenv("SCREENSHOT_JPEG_QUALITY", 40))
+    # Hand records to a background writer thread instead of formatting and writing inline.
+    LOG_ASYNC = os.getenv("LOG_ASYNC", "false").lower() == "true"
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    # text | json, for log files; the console keeps its colours.
+    LOG_FILE_FORMAT = os.getenv("LOG_FILE_FORMAT", "text")
+
+
+class UserLoggerAdapter(logging.LoggerAdapter):
+    """Tags records with the user they belong to and prefixes the message for shared handlers."""
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = self.extra
+        return f"[{self.extra['user']}] {msg}", kwargs
+
+
+class UserLogRouter(logging.Handler):
+    """
+    Routes records from UserLoggerAdapter to per-user files through one handler.
+
+    In 'files' mode each user gets logs/<email>.log, with at most USER_LOG_MAX_OPEN_FILES kept open
+    (least recently used are closed) and files rotated at USER_LOG_MAX_BYTES. In 'jsonl' mode every
+    record goes to a single rotated logs/users.jsonl stream keyed by user and requestId.
+    """
+
+    def __init__(self, mode=None, directory='logs'):
+        super().__init__(LogConfig.LOG_LEVEL)
+        # Only records from UserLoggerAdapter carry a user; others may reach this handler via a QueueListener.
+        self.addFilter(lambda record: hasattr(record, "user"))
+        self.mode = mode or os.getenv("USER_LOG_MODE", "files")
+        self.directory = directory
+        self.max_open_files = int(os.getenv("USER_LOG_MAX_OPEN_FILES", 64))
+        self.max_bytes = int(os.getenv("USER_LOG_MAX_BYTES", 1024 * 1024))
+        self.open_files = collections.OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == "jsonl":
+            self.stream_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(directory, 'users.jsonl'), maxBytes=self.max_bytes * 100, backupCount=5)
+            self.stream_handler.setFormatter(JsonFormatter())
+        else:
+            # The user is already in the file name and in the message prefix.
+            self.setFormatter(logging.Formatter(
+                '%(asctime)s - %(levelname)s - %(message)s'))
+
+    def emit(self, record):
+        try:
+            if self.mode == "jsonl":
+                self.stream_handler.emit(record)
+                return
+            user = getattr(record, "user", None) or "unknown"
+            stream = self._open(user)
+            stream.write(self.format(record) + "\n")
+            stream.flush()
+            if stream.tell() >= self.max_bytes:
+                self._rotate(user)
+        except Exception:
+            self.handleError(record)
+
+    def _path(self, user):
+        return os.path.join(self.directory, f"{user}.log")
+
+    def _open(self, user):
+        stream = self.open_files.pop(user, None)
+        if stream is None:
+            if len(self.open_files) >= self.max_open_files:
+                _, oldest = self.open_files.popitem(last=False)
+                oldest.close()
+            stream = open(self._path(user), 'a')
+        self.open_files[user] = stream
+        return stream
+
+    def _rotate(self, user):
+        self.open_files.pop(user).close()
+        os.replace(self._path(user), self._path(user) + ".1")
+
+    def close(self):
+        self.acquire()
+        try:
+            for stream in self.open_files.values():
+                stream.close()
+            self.open_files.clear()
+            if self.mode == "jsonl":
+                self.stream_handler.close()
+        finally:
+            self.release()
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, without colour codes."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("user", "request_id"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking the caller when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def depth(self):
+        return self.queue.qsize()
 
 
 class LoggerManager:
@@ -33,7 +166,6 @@ class LoggerManager:
         formatter = ColoredFormatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         console_handler.setFormatter(formatter)
-        logging.getLogger().addHandler(console_handler)
 
         # Setting up file logging for console logs
         if not os.path.exists('logs/console_logs'):
@@ -41,25 +173,56 @@ class LoggerManager:
         console_file_handler = logging.FileHandler(
             f'logs/console_logs/console.log')
         console_file_handler.setLevel(LogConfig.LOG_LEVEL)
-        console_file_handler.setFormatter(formatter)
-        logging.getLogger().addHandler(console_file_handler)
+        if LogConfig.LOG_FILE_FORMAT == "json":
+            console_file_handler.setFormatter(JsonFormatter())
+        else:
+            console_file_handler.setFormatter(logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        handlers = [console_handler, console_file_handler]
+        if LogConfig.LOG_ASYNC:
+            # Per-user records propagate to the root logger and are routed on the writer thread too.
+            LoggerManager._user_router = UserLogRouter()
+            logging.getLogger("users").setLevel(LogConfig.LOG_LEVEL)
+            handlers.append(LoggerManager._user_router)
+            LoggerManager.queue_handler = DroppingQueueHandler(
+                queue.Queue(maxsize=LogConfig.LOG_QUEUE_SIZE))
+            LoggerManager._queue_listener = logging.handlers.QueueListener(
+                LoggerManager.queue_handler.queue, *handlers, respect_handler_level=True)
+            LoggerManager._queue_listener.start()
+            handlers = [LoggerManager.queue_handler]
+        for handler in handlers:
+            logging.getLogger().addHandler(handler)
 
         # Setting the log level
         logging.getLogger().setLevel(LogConfig.LOG_LEVEL)
 
+    _user_router = None
+    _user_router_lock = threading.Lock()
+    _queue_listener = None
+    queue_handler = None
+
     @staticmethod
-    def setup_logger(email):
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-        logger = logging.getLogger(email)
-        logger.setLevel(LogConfig.LOG_LEVEL)
-        fh = logging.FileHandler(f'logs/{email}.log')
-        fh.setLevel(LogConfig.LOG_LEVEL)
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        fh.setFormatter(formatter)
-        logger.addHandler(fh)
-        return logger
+    def stop_logging():
+        """Flush and stop the background writer, if one is running."""
+        if LoggerManager._queue_listener:
+            LoggerManager._queue_listener.stop()
+            LoggerManager._queue_listener = None
+
+    @staticmethod
+    def setup_logger(email, request_id=None):
+        """
+        Return a logger for one user. Every user shares the 'users' logger and a single routing
+        handler, so nothing is created per user beyond this lightweight adapter.
+        """
+        users_logger = logging.getLogger("users")
+        # Browser workers set up their loggers concurrently; only one of them may attach the router.
+        with LoggerManager._user_router_lock:
+            if LoggerManager._user_router is None:
+                users_logger.setLevel(LogConfig.LOG_LEVEL)
+                LoggerManager._user_router = UserLogRouter()
+                users_logger.addHandler(LoggerManager._user_router)
+        return UserLoggerAdapter(users_logger, {"user": email, "request_id": request_id})
 
     @staticmethod
     def capture_screenshot(driver, email):
@@ -102,3 +265,43 @@ class LoggerManager:
             driver.save_screenshot(screenshot_path)
         except Exception as e:
             logging.error(f"Error capturing screenshot for debug: {str(e)}")
+
+
+class DebugScreenshotRecorder:
+    """Captures debug screenshots for one user according to LogConfig.SCREENSHOT_POLICY."""
+
+    def __init__(self, driver_manager, email, policy=None):
+        self.driver_manager = driver_manager
+        self.email = email
+        policy = policy or LogConfig.SCREENSHOT_POLICY
+        if policy == "sampled":
+            policy = "always" if random.random() < LogConfig.SCREENSHOT_SAMPLE_RATE else "off"
+        self.policy = policy
+        self.buffer = collections.deque(maxlen=LogConfig.SCREENSHOT_BUFFER_SIZE)
+
+    def capture(self, name):
+        if self.policy == "always":
+            LoggerManager.capture_screenshot_for_debug(
+                self.driver_manager.driver, self.email, name)
+        elif self.policy == "on-failure":
+            # Keep a small JPEG in memory; it only reaches the disk if the user fails.
+            try:
+                result = self.driver_manager.execute_cdp_cmd("Page.captureScreenshot", {
+                    "format": "jpeg", "quality": LogConfig.SCREENSHOT_JPEG_QUALITY})
+                self.buffer.append((name, result["data"]))
+            except Exception as e:
+                logging.debug(f"Error buffering screenshot for debug: {str(e)}")
+
+    def flush(self):
+        """Write the buffered screenshots to screenshots/debug/<email>/."""
+        if not self.buffer:
+            return
+        try:
+            screenshot_dir = os.path.join('screenshots', 'debug', self.email)
+            os.makedirs(screenshot_dir, exist_ok=True)
+            for index, (name, data) in enumerate(self.buffer):
+                with open(os.path.join(screenshot_dir, f"{index:02d}_{name}.jpg"), 'wb') as f:
+                    f.write(base64.b64decode(data))
+            self.buffer.clear()
+        except Exception as e:
+            logging.error(f"Error flushing debug screenshots: {str(e)}")
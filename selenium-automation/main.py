@@ -1,95 +1,196 @@
 import argparse
 import os
+import sys
 import json
 import logging
 import threading
+import time
 import atexit
 from logger import LoggerManager
-from driver_manager import DriverManager
+from driver_manager import DriverManager, DriverPool, SharedBrowser, ContextDriverManager, BACKENDS, DEFAULT_BACKEND
 from microsoft_credential_manager import MicrosoftSignIn, SecurityKeysLimitException, TwoFactorAuthRequiredException, OrganizationNeedsMoreInformationException, MicrosoftAccessPassValidationException
 from rabbitmq_manager import RabbitMQManager
 from services import AzureAutoOBRClient
+from http_client import HttpClient
+from status_reporter import StatusReporter
+from adaptive_timeouts import AdaptiveTimeouts
+from dedup_index import DedupIndex
+from job_store import JobStore
+import metrics
+from metrics import USERS_PROCESSED, MESSAGES_RETRIED, ISSUER_WAIT, DUPLICATES_SKIPPED
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from tap import TAPRetrievalFailureException
-import time
-import functools
-
-
-def retry(exceptions, tries=3, delay=5, backoff=2):
-    """
-    Decorator for retrying a function if exception occurs.
-
-    :param exceptions: Exceptions that trigger a retry
-    :param tries: Number of tries to attempt
-    :param delay: Initial delay between retries in seconds
-    :param backoff: Backoff multiplier e.g. value of 2 will double the delay each retry
-    """
-    def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            mtries, mdelay = tries, delay
-            while mtries > 0:
-                try:
-                    return func(*args, **kwargs, retries_exhausted=False)
-                except exceptions as e:
-                    if isinstance(e, MicrosoftAccessPassValidationException):
-                        mtries += 2
-                    msg = f"Retrying in {mdelay} seconds..."
-                    logging.info(msg)  # or use logging
-                    time.sleep(mdelay)
-                    mtries -= 1
-                    mdelay *= backoff
-            return func(*args, **kwargs, retries_exhausted=True)
-        return wrapper
-    return decorator
+from tap_prefetcher import TAPPrefetcher
+from fair_scheduler import FairScheduler, parse_issuer_settings
+from concurrent.futures import ThreadPoolExecutor
 
 
 class MainApp:
     """Orchestrates the entire process."""
 
+    # Failures that may succeed later; they are retried through the delayed retry queues.
+    RETRYABLE_EXCEPTIONS = (TimeoutException, TAPRetrievalFailureException, MicrosoftAccessPassValidationException)
+
     def __init__(self):
         LoggerManager.setup_console_logging()
         logging.info("Starting the automation script...")
         self.azure_auto_obr_client = AzureAutoOBRClient()
-        self.ms_signin = None
+        self.status_reporter = None
         self.test_mode = False
         self.rabbitmq_manager = None
-        self.driver_manager = None
+        self.dedup_index = None
+        self.job_store = None
+        self.driver_pools = {}
+        self.shared_browsers = {}
+        self.backend = DEFAULT_BACKEND
+        self.workers = 1
+        self.executor = None
+        self.tap_prefetcher = None
+        self.tap_prefetch = 0
+        self.scheduler = None
+        self.issuer_queues = 0
+        self.issuer_weights = {}
+        self.issuer_max_concurrency = {}
+        self.default_issuer_max_concurrency = 0
         self.mode = None
+        self.retry_delays = [int(delay) for delay in os.environ.get("RETRY_DELAYS", "60,300").split(",") if delay]
         # Define an event to handle termination
         self.terminate_event = threading.Event()
+        self.connection_lost = False
 
     def initialize_resources(self):
         if not self.test_mode:
+            self.status_reporter = StatusReporter(self.azure_auto_obr_client)
+            self.status_reporter.start()
+            metrics.register_status_reporter(self.status_reporter)
+            self.dedup_index = DedupIndex()
+            self.job_store = JobStore()
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="browser-worker")
+            if self.tap_prefetch > 0:
+                self.tap_prefetcher = TAPPrefetcher(concurrency=self.tap_prefetch)
+            # Every worker plus the TAPs being fetched ahead of them are in progress at once, so a
+            # browser worker always has a user ready.
+            slots = self.workers + self.tap_prefetch
+            self.scheduler = FairScheduler(
+                slots, self._start_message, weights=self.issuer_weights,
+                caps=self.issuer_max_concurrency, default_cap=self.default_issuer_max_concurrency)
+            metrics.register_fair_scheduler(self.scheduler)
+            # At most one delivery per slot is unacknowledged across all the queues, and the scheduler
+            # chooses among the deliveries of all of them.
             self.rabbitmq_manager = RabbitMQManager(
-                host=os.environ.get("RABBITMQ_HOSTNAME", "localhost"), port=5672, queue_name='obr', consumer_callback=self.queue_consumer)
+                host=os.environ.get("RABBITMQ_HOSTNAME", "localhost"), port=5672, queue_name='obr',
+                consumer_callback=self.queue_consumer, prefetch_count=slots,
+                retry_delays=self.retry_delays, issuer_queues=self.issuer_queues,
+                on_connection_lost=self._connection_lost)
             self.rabbitmq_manager.start()
             # self.start_heartbeat()
 
+    def _connection_lost(self, error):
+        # Without a channel nothing in progress can be acknowledged; exit so the container restarts
+        # and the broker redelivers whatever was unacknowledged.
+        self.connection_lost = True
+        self.terminate_event.set()
+
     def queue_consumer(self, ch, method, properties, body):
+        # Runs on the pika connection thread: hand the message to the scheduler and return
+        # immediately so the connection keeps servicing heartbeats and further deliveries.
         try:
             message = json.loads(body)
-            self.process_message(message)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
         except json.JSONDecodeError:
             logging.error("Failed to decode message body as JSON.")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        if self.dedup_index.is_done(message.get("requestId"), message.get("userId")):
+            # A redelivery or a duplicate publish of a user whose key is already registered.
+            logging.info(f"Skipping user {message.get('userId')}: already provisioned for request {message.get('requestId')}.")
+            DUPLICATES_SKIPPED.inc()
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        headers = properties.headers or {}
+        # Retries come back from the retry queues with the number of the attempt in a header.
+        attempt = headers.get("x-attempt", 0)
+        self.scheduler.submit(
+            message.get("issuerId") or "unknown",
+            (message, method.delivery_tag, attempt, headers.get("x-enqueued-at")))
+
+    def _start_message(self, issuer, item):
+        # Called by the scheduler once the message has a slot; the slot is freed by _finish.
+        message, delivery_tag, attempt, enqueued_at = item
+        if enqueued_at:
+            ISSUER_WAIT.labels(issuer=issuer).observe(max(0, time.time() - float(enqueued_at)))
+        if self.tap_prefetcher:
+            self.tap_prefetcher.submit(
+                message,
+                on_ready=lambda message, tap: self.executor.submit(
+                    self._finish, issuer, self.handle_message, message, delivery_tag, tap, attempt),
+                on_failure=lambda message, ex: self._finish(
+                    issuer, self.handle_tap_failure, message, delivery_tag, ex, attempt))
+        else:
+            self.executor.submit(self._finish, issuer, self.handle_message, message, delivery_tag, None, attempt)
+
+    def _finish(self, issuer, handler, *args):
+        try:
+            handler(*args)
+        finally:
+            self.scheduler.done(issuer)
+
+    def handle_tap_failure(self, message, delivery_tag, ex, attempt=0):
+        # A user without a TAP can never sign in, so fail or retry it without allocating a browser.
+        logging.error(f"Failed to prefetch TAP: {ex}")
+        if attempt < len(self.retry_delays):
+            self._retry_later(message, delivery_tag, attempt, ex)
+            return
+        self._record_outcome(message.get("userId"), message.get("requestId"), "failed", str(ex))
+        self._report_status(message.get("userId"),
+                            message.get("requestId"), "failed", str(ex))
+        self.rabbitmq_manager.ack(delivery_tag)
+
+    def handle_message(self, message, delivery_tag, tap=None, attempt=0):
+        # Runs on a browser worker thread; acks are marshalled back onto the connection thread.
+        retries_exhausted = attempt >= len(self.retry_delays)
+        try:
+            self.job_store.update(message.get("requestId"), message.get("userId"),
+                                  JobStore.IN_PROGRESS, attempts=attempt + 1)
+            self.process_message(message, tap=tap, retries_exhausted=retries_exhausted)
+            self.rabbitmq_manager.ack(delivery_tag)
+        except self.RETRYABLE_EXCEPTIONS as ex:
+            if retries_exhausted:
+                # The final status has already been reported by process_message.
+                self.rabbitmq_manager.ack(delivery_tag)
+            else:
+                self._retry_later(message, delivery_tag, attempt, ex)
         except Exception as ex:
             logging.error(f"Error processing message: {ex}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            # Free the dedup claim so the user can be provisioned by a retried request.
+            self._record_outcome(message.get("userId"), message.get("requestId"), "failed", str(ex))
+            self._report_status(message.get("userId"), message.get("requestId"), "failed", str(ex))
+            self.rabbitmq_manager.nack(delivery_tag, requeue=False)
+
+    def _retry_later(self, message, delivery_tag, attempt, ex):
+        # The worker moves straight on to other users while this one waits out its delay in RabbitMQ.
+        delay = self.rabbitmq_manager.retry_later(delivery_tag, json.dumps(message), attempt + 1)
+        MESSAGES_RETRIED.labels(reason=ex.__class__.__name__).inc()
+        self.job_store.update(message.get("requestId"), message.get("userId"), JobStore.RETRYING,
+                              f"{ex.__class__.__name__}: {ex}. Retrying in {delay} seconds.")
+        logging.info(
+            f"Retrying user {message.get('userId')} in {delay} seconds "
+            f"(attempt {attempt + 1} of {len(self.retry_delays)}).")
 
-    @retry((TimeoutException, TAPRetrievalFailureException), tries=1, delay=0, backoff=2)
-    def process_message(self, message, retries_exhausted=False):
-        self.driver_manager = DriverManager(mode=self.mode)
-        self.ms_signin = MicrosoftSignIn(self.driver_manager)
+    def process_message(self, message, tap=None, retries_exhausted=False):
         status, detail = "failed", "An unknown error occurred during processing."
+        driver_manager = None
+        driver_healthy = True
+        email = message.get("email")
+        user_id = message.get("userId")
+        issuer_id = message.get("issuerId")
+        requestId = message.get("requestId")
         try:
-            email = message.get("email")
-            user_id = message.get("userId")
-            issuer_id = message.get("issuerId")
-            requestId = message.get("requestId")
-
-            self.ms_signin.register_security_key(
-                email=email, user_id=user_id, issuer_id=issuer_id)
+            # Acquired inside the try so a browser that fails to launch still gets a final status.
+            driver_manager = self._acquire_driver(self._message_backend(message))
+            ms_signin = MicrosoftSignIn(driver_manager)
+            ms_signin.register_security_key(
+                email=email, user_id=user_id, issuer_id=issuer_id, prefetched_tap=tap, request_id=requestId)
             status, detail = "done", "Credential successfully created."
             retries_exhausted = True
         except MicrosoftAccessPassValidationException as ex:
@@ -111,6 +212,7 @@ class MainApp:
         except WebDriverException as ex:
             detail = "Internal error occurred. Retry may lead to success."
             logging.error(f"{detail}: {ex}")
+            driver_healthy = False
             retries_exhausted = True
         except TAPRetrievalFailureException as ex:
             detail = str(ex)
@@ -132,19 +234,57 @@ class MainApp:
                 pass
                 # TODO: Capturing screenshots are ignore due to memory restriction.
                 # LoggerManager.capture_screenshot(
-                #     self.driver_manager.driver, email)
+                #     driver_manager.driver, email)
                 # LoggerManager.capture_browser_logs(
-                #     self.driver_manager.driver, email)
-            self.driver_manager.close()
+                #     driver_manager.driver, email)
+            if driver_manager:
+                self._release_driver(driver_manager, driver_healthy)
             if retries_exhausted:
-                if not self.test_mode and status:  # Update status only when not in test_mode
-                    try:
-                        self.azure_auto_obr_client.update_request_status(
-                            user_id, requestId, status, detail)
-                    except Exception as ex:
-                        logging.error(str(ex))
-                else:
-                    logging.info(f"{status}: {detail}")
+                USERS_PROCESSED.labels(status=status).inc()
+                self._record_outcome(user_id, requestId, status, detail)
+                self._report_status(user_id, requestId, status, detail)
+
+    def _record_outcome(self, user_id, requestId, status, detail):
+        # Unset in test mode, where messages do not come from the provisioning API.
+        if not self.job_store:
+            return
+        self.job_store.update(requestId, user_id, status, detail)
+        if status == "done":
+            self.dedup_index.mark_done(requestId, user_id)
+        else:
+            # A failed user may be provisioned again by a retried request.
+            self.dedup_index.release(requestId, [user_id])
+
+    def _report_status(self, user_id, requestId, status, detail):
+        if not self.test_mode and status:  # Update status only when not in test_mode
+            # Delivered by the background reporter so the worker can move on to the next user.
+            self.status_reporter.enqueue(user_id, requestId, status, detail)
+        else:
+            logging.info(f"{status}: {detail}")
+
+    def _message_backend(self, message):
+        backend = message.get("backend") or self.backend
+        if backend not in BACKENDS:
+            logging.warning(f"Unknown backend '{backend}', using '{self.backend}'.")
+            return self.backend
+        return backend
+
+    def _acquire_driver(self, backend):
+        driver_pool = self.driver_pools.get(backend)
+        if driver_pool:
+            return driver_pool.acquire()
+        shared_browser = self.shared_browsers.get(backend)
+        if shared_browser:
+            return ContextDriverManager(shared_browser, mode=self.mode, backend=backend)
+        return DriverManager(mode=self.mode, backend=backend)
+
+    def _release_driver(self, driver_manager, healthy=True):
+        driver_pool = self.driver_pools.get(driver_manager.backend)
+        if driver_pool:
+            driver_pool.release(driver_manager, healthy=healthy)
+            logging.info(f"Driver pool metrics ({driver_manager.backend}): {driver_pool.metrics()}")
+        else:
+            driver_manager.close()
 
     def run(self):
         parser = argparse.ArgumentParser(
@@ -159,20 +299,76 @@ class MainApp:
                             help="The user/admin who requests/issues the request. Required in debug mode.")
         parser.add_argument("--test", action='store_true',
                             help="Set to true to run in test mode. Default is false.")
+        parser.add_argument("--pool-size", type=int, default=int(os.environ.get("DRIVER_POOL_SIZE", 0)),
+                            help="Number of pre-launched Chrome sessions to reuse across users. 0 launches a new browser per message.")
+        parser.add_argument("--lite-pool-size", type=int, default=int(os.environ.get("LITE_DRIVER_POOL_SIZE", 0)),
+                            help="Number of pre-launched lite Chrome sessions, used by messages with backend 'lite'.")
+        parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                            help="Browser backend for messages that do not name one. 'lite' blocks images, fonts and analytics and trims Chrome's footprint.")
+        parser.add_argument("--shared-browser", action="store_true",
+                            default=os.environ.get("SHARED_BROWSER", "false").lower() == "true",
+                            help="Run each user in its own browser context of one shared Chrome process per backend instead of a Chrome per user.")
+        parser.add_argument("--disk-cache-dir", type=str, default=os.environ.get("DRIVER_DISK_CACHE_DIR", ""),
+                            help="Directory for per-slot Chrome disk caches kept across pooled sessions. Empty keeps the cache in memory.")
+        parser.add_argument("--pool-max-uses", type=int, default=int(os.environ.get("DRIVER_POOL_MAX_USES", 50)),
+                            help="Number of users a pooled Chrome session serves before it is recycled.")
+        parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", 1)),
+                            help="Number of users provisioned in parallel, each in its own browser.")
+        parser.add_argument("--tap-prefetch", type=int, default=int(os.environ.get("TAP_PREFETCH", 0)),
+                            help="Number of TAPs fetched concurrently ahead of the browser workers. 0 fetches the TAP inside the browser worker.")
+        parser.add_argument("--issuer-queues", type=int, default=int(os.environ.get("ISSUER_QUEUES", 16)),
+                            help="Number of issuer queues the API spreads issuers over; must match the API's ISSUER_QUEUES.")
+        parser.add_argument("--issuer-weights", type=str, default=os.environ.get("ISSUER_WEIGHTS", ""),
+                            help="Round-robin weights as issuer=weight,...; issuers not listed have weight 1.")
+        parser.add_argument("--issuer-max-concurrency", type=str, default=os.environ.get("ISSUER_MAX_CONCURRENCY", ""),
+                            help="Per-issuer caps on users in progress as issuer=cap,...")
+        parser.add_argument("--default-issuer-max-concurrency", type=int,
+                            default=int(os.environ.get("DEFAULT_ISSUER_MAX_CONCURRENCY", 0)),
+                            help="Cap on users in progress for issuers without their own cap. 0 means no cap.")
+        parser.add_argument("--metrics-port", type=int, default=int(os.environ.get("METRICS_PORT", 9100)),
+                            help="Port serving Prometheus metrics on /metrics. 0 disables the endpoint.")
         args = parser.parse_args()
 
         self.test_mode = args.test
+        self.workers = max(1, args.workers)
+        self.tap_prefetch = max(0, args.tap_prefetch)
+        self.issuer_queues = max(0, args.issuer_queues)
+        self.issuer_weights = parse_issuer_settings(args.issuer_weights)
+        self.issuer_max_concurrency = parse_issuer_settings(args.issuer_max_concurrency)
+        self.default_issuer_max_concurrency = max(0, args.default_issuer_max_concurrency)
 
         self.mode = args.mode
+        self.backend = args.backend
+        if args.metrics_port:
+            metrics.register_http_client(HttpClient())
+            if LoggerManager.queue_handler:
+                metrics.register_log_queue(LoggerManager.queue_handler)
+            metrics.start_metrics_server(args.metrics_port)
+        if args.shared_browser:
+            # Each shared Chrome is launched by the first context created in it.
+            for backend in BACKENDS:
+                self.shared_browsers[backend] = SharedBrowser(mode=self.mode, backend=backend)
+                metrics.register_shared_browser(self.shared_browsers[backend])
+        for backend, size in (("chrome", args.pool_size), ("lite", args.lite_pool_size)):
+            if size > 0:
+                driver_pool = DriverPool(
+                    size=size, max_uses=args.pool_max_uses, mode=self.mode, backend=backend,
+                    shared_browser=self.shared_browsers.get(backend), disk_cache_dir=args.disk_cache_dir or None)
+                metrics.register_driver_pool(driver_pool)
+                driver_pool.start()
+                self.driver_pools[backend] = driver_pool
         if (self.test_mode):
             self.process_message({
                 "email": args.email,
                 "userId": args.userId,
                 "issuerId": args.issuerId
-            })
+            }, retries_exhausted=True)
         else:
             self.initialize_resources()
             self.terminate_event.wait()
+            if self.connection_lost:
+                logging.error("Lost the connection to RabbitMQ, exiting.")
+                sys.exit(1)
         logging.info("Automation script finished.")
 
     def close_resources(self):
@@ -180,7 +376,16 @@ class MainApp:
             # self.stop_heartbeat()
             self.rabbitmq_manager.stop()
             self.terminate_event.set()  # Set the termination event to release the main thread
-            self.driver_manager.close()
+            self.executor.shutdown(wait=False)
+            if self.tap_prefetcher:
+                self.tap_prefetcher.close()
+            self.status_reporter.stop()
+        for driver_pool in self.driver_pools.values():
+            driver_pool.close()
+        for shared_browser in self.shared_browsers.values():
+            shared_browser.close()
+        AdaptiveTimeouts().save()
+        LoggerManager.stop_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""Prometheus metrics for the provisioning worker, served on /metrics by start_metrics_server()."""
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Step latencies range from sub-second clicks to minute-long Microsoft page loads.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120)
+
+STEP_DURATION = Histogram(
+    "signin_step_duration_seconds", "Duration of each step of the Microsoft sign-in flow.",
+    ["step"], buckets=LATENCY_BUCKETS)
+STEP_OUTCOMES = Counter(
+    "signin_step_total", "Sign-in flow steps by outcome.", ["step", "outcome"])
+STEP_RESUMES = Counter(
+    "signin_step_resumes_total", "Failed sign-in steps resumed in the same browser session.", ["step"])
+DRIVER_STARTUP = Histogram(
+    "driver_startup_seconds", "Time to launch a Chrome session.", buckets=LATENCY_BUCKETS)
+TAP_FETCH = Histogram(
+    "tap_fetch_duration_seconds", "Time to retrieve a Temporary Access Pass.", buckets=LATENCY_BUCKETS)
+TAP_FETCH_OUTCOMES = Counter(
+    "tap_fetch_total", "TAP retrievals by outcome.", ["outcome"])
+STATUS_UPDATE = Histogram(
+    "status_update_duration_seconds", "Time to deliver status updates to the AuthN API.",
+    buckets=LATENCY_BUCKETS)
+STATUS_UPDATE_OUTCOMES = Counter(
+    "status_update_total", "Status update deliveries by outcome.", ["outcome"])
+USER_TRANSFER_BYTES = Histogram(
+    "user_transfer_bytes", "Bytes received by the browser while provisioning one user.", ["backend"],
+    buckets=(1e5, 2.5e5, 5e5, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6))
+BLOCKED_REQUESTS = Counter(
+    "blocked_requests_total", "Requests blocked by the network policy.", ["backend"])
+ADAPTIVE_TIMEOUT = Gauge(
+    "adaptive_timeout_seconds", "Current adaptive timeout of each sign-in wait.", ["wait"])
+MESSAGES_RETRIED = Counter(
+    "messages_retried_total", "Messages parked in a delayed retry queue, by failure.", ["reason"])
+ISSUER_WAIT = Histogram(
+    "issuer_wait_seconds", "Time from enqueue until a worker starts the user, by issuer.", ["issuer"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400))
+DUPLICATES_SKIPPED = Counter(
+    "duplicates_skipped_total", "Deliveries of users already provisioned for their request, acked unprocessed.")
+USERS_PROCESSED = Counter(
+    "users_processed_total", "Users processed by final status.", ["status"])
+
+
+DRIVER_POOL_GAUGES = {
+    key: Gauge(f"driver_pool_{key}", f"Driver pool {key.replace('_', ' ')}.", ["backend"])
+    for key in ("hits", "misses", "recycled", "reset_failures", "idle", "reset_time_avg")}
+
+
+def register_driver_pool(driver_pool):
+    for key, gauge in DRIVER_POOL_GAUGES.items():
+        gauge.labels(backend=driver_pool.backend).set_function(
+            lambda key=key: driver_pool.metrics()[key])
+
+
+def register_shared_browser(shared_browser):
+    Gauge(f"shared_browser_{shared_browser.backend}_contexts",
+          f"Open browser contexts in the shared {shared_browser.backend} Chrome.").set_function(
+        lambda: shared_browser.contexts)
+
+
+def register_fair_scheduler(fair_scheduler):
+    Gauge("scheduler_buffered", "Deliveries buffered in the fair scheduler.").set_function(
+        fair_scheduler.buffered)
+
+
+def register_http_client(http_client):
+    for key in ("requests", "attempts", "retries", "failures"):
+        Gauge(f"http_client_{key}", f"AuthN HTTP client {key.replace('_', ' ')}.").set_function(
+            lambda key=key: http_client.metrics()[key])
+
+
+def register_status_reporter(status_reporter):
+    Gauge("status_outbox_pending", "Status updates waiting in the outbox.").set_function(
+        status_reporter.pending)
+
+
+def register_log_queue(queue_handler):
+    Gauge("log_queue_depth", "Log records waiting for the background writer.").set_function(
+        queue_handler.depth)
+    Gauge("log_records_dropped", "Log records dropped because the log queue was full.").set_function(
+        lambda: queue_handler.dropped)
+
+
+def start_metrics_server(port):
+    start_http_server(port)
@@ -1,17 +1,22 @@
 from selenium.webdriver.support.ui import WebDriverWait
 import threading
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 import random
 import string
 import datetime
 from tap import TAPManager, TAPRetrievalFailureException
 import time
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from logger import LoggerManager
+from logger import LoggerManager, DebugScreenshotRecorder
+from page_state import PageStateWaiter
+from flow_engine import Detector, FlowEngine, PageState
+from locators import LOCATORS, POLL_FREQUENCY
+from metrics import STEP_DURATION, STEP_OUTCOMES, STEP_RESUMES, USER_TRANSFER_BYTES, BLOCKED_REQUESTS
+from contextlib import contextmanager
+from console_monitor import ConsoleErrorMonitor
+from adaptive_timeouts import AdaptiveTimeouts
 import os
+import re
 from dotenv import load_dotenv
-import json
 
 load_dotenv()
 
@@ -39,24 +44,78 @@ class TwoFactorAuthRequiredException(Exception):
 class MicrosoftSignIn:
     """Handles the Microsoft sign-in process."""
 
+    # Default wait budgets, used until AdaptiveTimeouts has observed enough of each wait.
     LONG_PROCESS = 60
     NORMAL_PROCESS = 30
     SHORT_PROCESS = 5
 
+    # Overridable so the flow can be driven against the offline stand-in in benchmarks/.
+    SECURITY_INFO_URL = os.getenv(
+        "MS_SECURITY_INFO_URL", "https://mysignins.microsoft.com/security-info")
+
+    # Page states after sign-in: every detector is polled together, so the happy path never
+    # waits out an error probe. Detectors are checked in order; errors come first.
+    POST_SIGN_IN = PageState("post_sign_in", [
+        Detector("more_information", LOCATORS["more_information_description"],
+                 error=OrganizationNeedsMoreInformationException,
+                 message="Your organization needs more information to keep your account secure on https://mysignins.microsoft.com/. You are receiving it because your organization has enabled security defaults in Microsoft Office 365."),
+        Detector("stay_signed_in", LOCATORS["stay_signed_in_yes_button"], clickable=True),
+        Detector("security_info", LOCATORS["add_method_button"], clickable=True),
+    ], NORMAL_PROCESS)
+
+    ADD_SECURITY_KEY = PageState("add_security_key", [
+        Detector("key_limit", LOCATORS["key_limit_banner"],
+                 text="You have already reached the limit of 10 security keys", error=SecurityKeysLimitException),
+        Detector("two_factor_required", LOCATORS["two_factor_required_message"],
+                 error=TwoFactorAuthRequiredException),
+        Detector("usb_device", LOCATORS["usb_device_button"], clickable=True),
+    ], NORMAL_PROCESS)
+
+    # The flow in order: (step name, method, locator showing the page is ready for the step,
+    # debug screenshot taken after it, whether a failed previous step may be skipped to reach it).
+    # Completed steps are checkpointed so a step that times out can be retried in the same session
+    # when its page is showing. Skipping ahead is only allowed when the ready locator exists solely
+    # on that step's page, so seeing it proves the previous step went through: the TAP page's sign-in
+    # button shows before the TAP is entered, and the key dialogs share a generic "Next" button.
+    FLOW = [
+        ("navigate", "_navigate", None, None, False),
+        ("email", "_submit_email", "email_input", "click_next", True),
+        ("tap_entry", "_enter_tap", "access_pass_input", "enter_tap", True),
+        ("sign_in", "_click_sign_in", "sign_in_button", "click_sign_in", False),
+        ("stay_signed_in", "_handle_post_sign_in", None, "handle_stay_signed_in_promp", False),
+        ("add_method", "_add_sign_in_method", "add_method_button", "add_sign_in_method", True),
+        ("select_key", "_add_security_key", "method_dropdown", None, True),
+        ("inject_js", "_inject_js_into_page", None, None, False),
+        ("key_name", "_fill_security_key_name", "security_key_name_input", "fill_security_key_name", False),
+        ("final_next", "_confirm_security_key", "final_next_button", None, False),
+    ]
+    RESUME_ATTEMPTS = int(os.getenv("STEP_RESUME_ATTEMPTS", 2))
+
+    # Console messages that mean the flow cannot succeed, matched as soon as they are logged.
+    CONSOLE_ERROR_SIGNATURES = [
+        (re.compile(r"an access pass could not be found or verified for the user", re.IGNORECASE),
+         MicrosoftAccessPassValidationException),
+    ]
+
     def __init__(self, driver_manager, test_mode=False):
         self.tap_manager = TAPManager()
+        self.driver_manager = driver_manager
         self.driver = driver_manager.driver
         self.test_mode = test_mode
+        self.page_state = PageStateWaiter(driver_manager)
+        self.timeouts = AdaptiveTimeouts()
+        self.flow = FlowEngine(self.driver, poll_frequency=POLL_FREQUENCY, timeouts=self.timeouts)
+        self.console_monitor = None
+        self.step_timings = []
+        self.checkpoint = 0
+        self.add_method_button = None
 
         with open("makeCredential.js", "r") as file:
             self.js_template = file.read()
 
     def _check_logs_for_errors(self):
-        logs = self.driver.get_log('browser')
-        for log in logs:
-            if "message" in log and "an access pass could not be found or verified for the user" in log["message"].lower():
-                raise MicrosoftAccessPassValidationException(
-                    "Access pass validation error detected.")
+        if self.console_monitor:
+            self.console_monitor.check()
 
     def _generate_security_key_name(self, user_id):
         shortened_customer_id = user_id[-8:]
@@ -65,26 +124,32 @@ class MicrosoftSignIn:
         date_str = datetime.datetime.now().strftime('%Y%m%d')
         return f"IDM-{shortened_customer_id}-{random_string}-{date_str}"
 
-    def _fill_security_key_name(self, user_id):
+    def _fill_security_key_name(self):
         try:
-            security_key_name = self._generate_security_key_name(user_id)
+            security_key_name = self._generate_security_key_name(self.user_id)
             self.logger.info(
                 f"Filling in security key name: {security_key_name}")
-            name_input = WebDriverWait(self.driver, self.LONG_PROCESS).until(
-                EC.presence_of_element_located(
-                    (By.XPATH, '//*[contains(@id, "TextField")]'))
-            )
+            name_input = self._wait_until(
+                "security_key_name_input", LOCATORS["security_key_name_input"].present(), self.LONG_PROCESS)
+            name_input.clear()
             name_input.send_keys(security_key_name)
         except Exception as e:
             self.logger.error(f"Error filling security key name: {str(e)}")
             raise
 
-    def register_security_key(self, email, user_id=None, issuer_id=None):
-        self.logger = LoggerManager.setup_logger(email)
+    def register_security_key(self, email, user_id=None, issuer_id=None, prefetched_tap=None, request_id=None):
+        self.logger = LoggerManager.setup_logger(email, request_id=request_id)
+        self.screenshots = DebugScreenshotRecorder(self.driver_manager, email)
+        self.email, self.user_id, self.issuer_id = email, user_id, issuer_id
         try:
-            self.logger.info("Retrieving TAP ...")
-            tap = self.tap_manager.retrieve_TAP(user_id, issuer_id)
-            self._navigate_and_fill_details(email, tap, user_id)
+            if prefetched_tap and prefetched_tap.is_usable():
+                self.logger.info("Using prefetched TAP ...")
+                self.tap = prefetched_tap.consume()
+            else:
+                self.logger.info("Retrieving TAP ...")
+                self.tap = self.tap_manager.retrieve_TAP(user_id, issuer_id)
+            self._start_console_monitor()
+            self._run_flow()
         except TAPRetrievalFailureException as e:
             self.logger.error(
                 f"Failed to retrieve tap: {str(e)}")
@@ -92,126 +157,158 @@ class MicrosoftSignIn:
         except Exception as e:
             self.logger.error(
                 f"Error registering security key for {email}: {str(e)}")
+            self.screenshots.capture("failure")
+            self.screenshots.flush()
             raise
+        finally:
+            if self.console_monitor:
+                self.console_monitor.stop()
+            self._record_network_usage()
 
-    def _handle_stay_signed_in_prompt(self):
+    def _record_network_usage(self):
         try:
-            WebDriverWait(self.driver, self.SHORT_PROCESS).until(
-                EC.presence_of_element_located(
-                    (By.XPATH, "//div[@class='row text-title' and @role='heading' and @aria-level='1']"))
-            )
-            self.logger.info("'Stay signed in?' prompt appeared.")
-            self._click_no_stay_signed_in()
+            usage = self.driver_manager.network_usage()
+        except WebDriverException as e:
+            self.logger.warning(f"Could not read network usage: {e}")
+            return
+        if usage:
+            received, finished, blocked = usage
+            backend = self.driver_manager.backend
+            USER_TRANSFER_BYTES.labels(backend=backend).observe(received)
+            BLOCKED_REQUESTS.labels(backend=backend).inc(blocked)
+            self.logger.info(
+                f"Network usage: {received / 1024:.0f} KiB over {finished} requests, {blocked} blocked.")
+
+    def _start_console_monitor(self):
+        if self.console_monitor:
+            self.console_monitor.stop()
+        self.console_monitor = ConsoleErrorMonitor(
+            self.driver, self.CONSOLE_ERROR_SIGNATURES, target_id=self.driver_manager.target_id)
+        self.console_monitor.start()
+        self.page_state.error_check = self.console_monitor.raise_if_matched
+        self.flow.error_check = self.console_monitor.raise_if_matched
+
+    def _run_flow(self):
+        """Run the flow from the checkpoint, resuming a failed step in place while that is possible."""
+        self.checkpoint = 0
+        self.step_timings = []
+        resumes = 0
+        try:
+            while True:
+                try:
+                    self._run_steps()
+                    self.logger.info("Credential Successfully Created!")
+                    return
+                except (TimeoutException, MicrosoftAccessPassValidationException) as e:
+                    failed_step = self.FLOW[self.checkpoint][0]
+                    resume_at = self._resume_point(e) if resumes < self.RESUME_ATTEMPTS else None
+                    if resume_at is None:
+                        raise
+                    resumes += 1
+                    self.logger.warning(
+                        f"Step '{failed_step}' failed ({e.__class__.__name__}), resuming at "
+                        f"'{self.FLOW[resume_at][0]}' in the same session.")
+                    STEP_RESUMES.labels(step=failed_step).inc()
+                    self.checkpoint = resume_at
+                    self._start_console_monitor()
+        finally:
+            self._log_step_report()
+
+    def _run_steps(self):
+        while self.checkpoint < len(self.FLOW):
+            name, method, _, screenshot, _ = self.FLOW[self.checkpoint]
+            with self._step(name):
+                getattr(self, method)()
+            self.checkpoint += 1
+            if screenshot:
+                self.screenshots.capture(screenshot)
+
+    def _resume_point(self, error):
+        """Index of the step to continue from in this session, or None if the flow must start over."""
+        if isinstance(error, MicrosoftAccessPassValidationException):
+            # Microsoft rejected the access pass: enter a new one if the prompt is still showing.
+            candidates = [self._step_index("tap_entry")]
+        else:
+            # Either the step never got going, or its action went through and only the next page was slow.
+            candidates = [self.checkpoint, self.checkpoint + 1]
+        for index in candidates:
+            if index >= len(self.FLOW):
+                continue
+            _, _, ready, _, skip_to = self.FLOW[index]
+            if index != self.checkpoint and not skip_to:
+                continue
+            if ready is None or self._is_showing(ready):
+                if isinstance(error, MicrosoftAccessPassValidationException):
+                    self.tap = self.tap_manager.retrieve_TAP(self.user_id, self.issuer_id)
+                # Elements found before the failure may belong to a page that has since been replaced.
+                self.add_method_button = None
+                return index
+        return None
+
+    def _step_index(self, name):
+        return next(index for index, step in enumerate(self.FLOW) if step[0] == name)
+
+    def _is_showing(self, locator_name):
+        try:
+            self._wait(self.SHORT_PROCESS).until(LOCATORS[locator_name].present())
+            return True
         except TimeoutException:
-            self.logger.debug("'Stay signed in?' prompt did not appear.")
+            return False
 
-    def _click_no_stay_signed_in(self):
-        # self._click_button(
-        #     "//input[@type='button' and @id='idBtn_Back' and @value='No']", "No")
-        self._click_button(
-            "//input[@type='submit' and @id='idSIButton9']", "Yes")
-
-    def _navigate_and_fill_details(self, email, tap, user_id):
+    @contextmanager
+    def _step(self, name):
+        """Time a step of the flow and record its outcome for the step report."""
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            yield
+            self._check_logs_for_errors()
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            duration = time.monotonic() - started
+            self.step_timings.append((name, duration, outcome))
+            STEP_DURATION.labels(step=name).observe(duration)
+            STEP_OUTCOMES.labels(step=name, outcome=outcome).inc()
+
+    def _log_step_report(self):
+        total = sum(duration for _, duration, _ in self.step_timings)
+        report = ", ".join(
+            f"{name}={duration:.2f}s" + ("" if outcome == "ok" else f" ({outcome})")
+            for name, duration, outcome in self.step_timings)
+        self.logger.info(f"Step timings (total {total:.2f}s): {report}")
+
+    def _navigate(self):
         self.logger.info(
             "Navigating to Microsoft sign-in, security-info page...")
-        self.driver.get("https://mysignins.microsoft.com/security-info")
+        self.page_state.install()
+        self.driver.get(self.SECURITY_INFO_URL)
         self.logger.info(
             "Log listener enabled...")
-        self._fill_email(email)
+
+    def _submit_email(self):
+        self._fill_email(self.email)
         self._click_next()
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "click_next")
-        self._enter_tap(tap)
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "enter_tap")
-        self._click_sign_in()
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "click_sign_in")
-        self._handle_stay_signed_in_prompt()
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "handle_stay_signed_in_promp")
-        self._check_require_more_information_error()
-        self._check_logs_for_errors()
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "check_require_more_information_error")
-        self._add_sign_in_method()
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "add_sign_in_method")
+
+    def _add_security_key(self):
         self._select_security_key()
         self._click_add_button()
         self._click_usb_device_button()
         self._click_next_to_add_sk()
-        self._inject_js_into_page(user_id)
-        self._fill_security_key_name(user_id)
-        LoggerManager.capture_screenshot_for_debug(
-            self.driver, email, "fill_security_key_name")
-        self._click_final_next_button()
-        time.sleep(5)
-        self.logger.info("Credential Successfully Created!")
-
-    def _check_require_more_information_error(self):
-        self.logger.info(
-            "Checking your organization requires more information...")
-        error_xpath = '//*[@id="ProofUpDescription"]'
-        try:
-            error_element = WebDriverWait(self.driver, self.SHORT_PROCESS).until(
-                EC.presence_of_element_located((By.XPATH, error_xpath)))
-            if error_element:
-                raise OrganizationNeedsMoreInformationException(
-                    "Your organization needs more information to keep your account secure on https://mysignins.microsoft.com/. You are receiving it because your organization has enabled security defaults in Microsoft Office 365.")
-        except TimeoutException:
-            self.logger.info(
-                "Organization needs more information... error did not happen")
-
-    def _check_for_sk_limit(self):
-        try:
-            error_element = WebDriverWait(self.driver, self.SHORT_PROCESS).until(
-                EC.presence_of_element_located(
-                    (By.ID, 'ms-banner')
-                )
-            )
-            error_message = error_element.text
-            if "You have already reached the limit of 10 security keys" in error_message:
-                self.logger.error(
-                    "You have already reached the limit of 10 security keys")
-                raise SecurityKeysLimitException(error_message)
-        except TimeoutException:
-            self.logger.debug(
-                "'ms-banner' element indicating 10 security keys limit did not appear. Proceed without error...")
-            raise
-
-    def _check_for_two_factor_auth_error(self):
-        error_xpath = "//div[contains(text(), 'To set up a security key, you need to sign in with two-factor authentication.')]"
-        try:
-            error_element = WebDriverWait(self.driver, self.SHORT_PROCESS).until(
-                EC.presence_of_element_located((By.XPATH, error_xpath)))
-            if error_element:
-                raise TwoFactorAuthRequiredException(error_element.text)
-        except TimeoutException:
-            raise
 
     def _click_next_to_add_sk(self):
-        self._click_button("//button[contains(@class, 'ms-Button--primary') and .//span[text()='Next']]",
-                           "next")
-
-    def _execute_cdp_cmd(self, cmd: str, params: dict = None):
-        params = params or {}
-        resource = f"/session/{self.driver.session_id}/chromium/send_command_and_get_result"
-        url = self.driver.command_executor._url + resource
-        body = {"cmd": cmd, "params": params}
-        response = self.driver.command_executor._request(
-            "POST", url, json.dumps(body))
-        return response.get("value")
-
-    def _inject_js_into_page(self, user_id):
+        self._click_button("add_security_key_next_button", "next")
+
+    def _inject_js_into_page(self):
         js_code = self.js_template.format(
             os.getenv("AUTHNAPI_URL") +
             os.getenv("AUTHNAPI_OBR_PATH"), os.getenv(
-                "PASSKEY_OBR_API_KEY"), user_id
+                "PASSKEY_OBR_API_KEY"), self.user_id
         )
         try:
-            result = self._execute_cdp_cmd(
-                "Page.addScriptToEvaluateOnNewDocument", {"source": js_code})
+            # Registered through the driver manager so a pooled session can drop it on reset.
+            result = self.driver_manager.add_script_on_new_document(js_code)
             if result:
                 self.logger.info("JS code injected successfully.")
             else:
@@ -221,100 +318,111 @@ class MicrosoftSignIn:
             raise
 
     def _click_add_button(self):
-        self._click_button(
-            "//button[@type='button' and .//span[text()='Add']]", "Add")
+        self._click_button("add_button", "Add")
 
     def _select_security_key(self):
         try:
             self.logger.info("Clicking the dropdown to expand...")
-            dropdown = WebDriverWait(self.driver, self.LONG_PROCESS).until(
-                EC.element_to_be_clickable(
-                    (By.XPATH, "//div[@role='combobox' and @aria-label='Authentication method options']"))
-            )
+            dropdown = self._wait_until(
+                "method_dropdown", LOCATORS["method_dropdown"].clickable(), self.LONG_PROCESS)
             dropdown.click()
             self.logger.info(
                 "Selecting 'Security key' from the expanded dropdown...")
-            security_key_option = WebDriverWait(self.driver, self.LONG_PROCESS).until(
-                EC.element_to_be_clickable(
-                    (By.XPATH, "//span[contains(@class, 'ms-Button-flexContainer') and .//span[text()='Security key']]"))
-            )
+            security_key_option = self._wait_until(
+                "security_key_option", LOCATORS["security_key_option"].clickable(), self.LONG_PROCESS)
             security_key_option.click()
         except Exception as e:
             self.logger.error(
                 f"Error selecting 'Security key' from dropdown: {str(e)}")
             raise
 
-    def _click_usb_device_button(self):
-        try:
-            self._click_button(
-                "//button[@type='button' and .//span[text()='USB device']]", "USB device")
-        except TimeoutException as e:
-            try:
-                self._check_for_sk_limit()
-                self._check_for_two_factor_auth_error()
-            except (SecurityKeysLimitException, TwoFactorAuthRequiredException) as e:
-                raise e
-            raise e
+    def _handle_post_sign_in(self):
+        """Resolve the pages between sign-in and the security-info page in one combined wait each."""
+        for _ in range(3):
+            outcome, element = self.flow.resolve(self.POST_SIGN_IN)
+            if outcome == "security_info":
+                self.add_method_button = element
+                return
+            self.logger.info("'Stay signed in?' prompt appeared.")
+            self.page_state.wait_before_click()
+            element.click()
+        raise TimeoutException("Security info page did not appear after sign-in.")
 
     def _add_sign_in_method(self):
-        try:
-            # Wait for the "Add method" button to be clickable for up to 15 seconds
-            self.logger.info("Clicking on 'Add sign-in method' button")
-            add_method_button = WebDriverWait(self.driver, self.NORMAL_PROCESS).until(
-                EC.element_to_be_clickable((By.NAME, "Add method"))
-            )
-
-            time.sleep(2)
-
-            # Once the button is clickable, click on it
-            add_method_button.click()
+        self.logger.info("Clicking on 'Add sign-in method' button")
+        self.page_state.wait_before_click()
+        # Found while resolving the post sign-in pages, unless the flow resumed here.
+        add_method_button = self.add_method_button or self._wait_until(
+            "add_method_button", LOCATORS["add_method_button"].clickable(), self.NORMAL_PROCESS)
+        add_method_button.click()
 
-            # Add additional actions here if needed
-
-        except TimeoutError as e:
-            self.logger.info(
-                f"Timeout while waiting for Add sign-in method button: {e}")
-            raise
-        # self._click_button(
-        #     "//span[text()='Add sign-in method']", "Add sign-in method", self.NORMAL_PROCESS)
+    def _click_usb_device_button(self):
+        self.logger.info("Clicking the USB device button...")
+        _, usb_button = self.flow.resolve(self.ADD_SECURITY_KEY)
+        self.page_state.wait_before_click()
+        usb_button.click()
 
     def _click_sign_in(self):
-        self._click_button("//input[@type='submit' and @value='Sign in' and contains(@class, 'button_primary')]",
-                           "sign in")
+        self._click_button("sign_in_button", "sign in")
 
     def _fill_email(self, email):
-        self._fill_input(
-            "//input[@type='email' and @name='loginfmt']", email, "email")
+        self._fill_input("email_input", email, "email")
 
     def _click_final_next_button(self):
-        self._click_button(
-            "//button[@type='button' and contains(@class, 'ms-Button') and contains(@class, 'ms-Button--primary') and .//span[text()='Next']]",
-            "Next")
+        self._click_button("final_next_button", "Next")
+
+    def _confirm_security_key(self):
+        self._click_final_next_button()
+        # Wait for the credential request and Microsoft's registration calls to finish.
+        self._wait_until_settled("final_settle", self.NORMAL_PROCESS, quiet_ms=1000)
 
     def _click_next(self):
-        self._click_button(
-            "//input[@type='submit' and @value='Next' and contains(@class, 'button_primary')]", "Next")
+        self._click_button("email_next_button", "Next")
+
+    def _enter_tap(self):
+        self._fill_input("access_pass_input", self.tap, "Temporary Access Pass")
 
-    def _enter_tap(self, tap):
-        self._fill_input("//input[@name='accesspass']",
-                         tap, "Temporary Access Pass")
+    def _wait(self, timeout):
+        return WebDriverWait(self.driver, timeout, poll_frequency=POLL_FREQUENCY)
 
-    def _click_button(self, xpath, button_name, extra_delay=0):
-        time.sleep(2)
+    def _wait_until(self, name, condition, default_timeout):
+        """Wait for a condition with the adaptive timeout of the named wait, and record how long it took."""
+        timeout = self.timeouts.timeout(name, default_timeout)
+        started = time.monotonic()
+        try:
+            result = self._wait(timeout).until(condition)
+        except TimeoutException:
+            self.timeouts.observe_timeout(name, timeout)
+            raise
+        self.timeouts.observe(name, time.monotonic() - started)
+        return result
+
+    def _wait_until_settled(self, name, default_timeout, quiet_ms=None):
+        timeout = self.timeouts.timeout(name, default_timeout)
+        started = time.monotonic()
+        settled = self.page_state.wait_until_settled(timeout=timeout, quiet_ms=quiet_ms)
+        # A page that never goes quiet (polling, animations) is not a slow page, so it teaches nothing.
+        if settled:
+            self.timeouts.observe(name, time.monotonic() - started)
+        return settled
+
+    def _click_button(self, locator_name, button_name, extra_delay=0):
+        self.page_state.wait_before_click()
         try:
             self.logger.info(f"Clicking the {button_name} button...")
-            button = WebDriverWait(self.driver, self.NORMAL_PROCESS + extra_delay).until(
-                EC.element_to_be_clickable((By.XPATH, xpath)))
+            button = self._wait_until(
+                locator_name, LOCATORS[locator_name].clickable(), self.NORMAL_PROCESS + extra_delay)
             button.click()
         except Exception as e:
             self.logger.error(f"Error clicking {button_name} button: {str(e)}")
             raise
 
-    def _fill_input(self, xpath, value, input_name):
+    def _fill_input(self, locator_name, value, input_name):
         try:
             self.logger.info(f"Filling in {input_name}: {value}")
-            input_field = WebDriverWait(self.driver, self.LONG_PROCESS).until(
-                EC.presence_of_element_located((By.XPATH, xpath)))
+            input_field = self._wait_until(
+                locator_name, LOCATORS[locator_name].present(), self.LONG_PROCESS)
+            input_field.clear()
             input_field.send_keys(value)
         except Exception as e:
             self.logger.error(f"Error filling {input_name}: {str(e)}")
@@ -0,0 +1,99 @@
+import logging
+import os
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Installed on every new document. Tracks in-flight fetch/XHR requests and the time of the
+# last DOM mutation so the automation can tell when the page has stopped changing. Keepalive
+# fetches (beacons) are not tracked, since nothing on the page waits for them.
+PAGE_STATE_SCRIPT = """
+(() => {
+    if (window.__pageState) return;
+    const state = window.__pageState = { pending: new Map(), nextId: 0, lastActivity: Date.now() };
+    const touch = () => { state.lastActivity = Date.now(); };
+    const begin = () => { const id = state.nextId++; state.pending.set(id, Date.now()); touch(); return id; };
+    const end = (id) => { state.pending.delete(id); touch(); };
+
+    new MutationObserver(touch).observe(document, { subtree: true, childList: true, attributes: true });
+
+    const originalFetch = window.fetch;
+    window.fetch = function (resource, options) {
+        if (options && options.keepalive) return originalFetch.apply(this, arguments);
+        const id = begin();
+        return originalFetch.apply(this, arguments).finally(() => end(id));
+    };
+
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        const id = begin();
+        this.addEventListener('loadend', () => end(id), { once: true });
+        return originalSend.apply(this, arguments);
+    };
+})();
+"""
+
+# Requests open longer than longRequestMs are long polls or streams that will not end while the
+# page is idle, so they do not hold the page unsettled.
+PAGE_SETTLED_CHECK = """
+const quietMs = arguments[0];
+const longRequestMs = arguments[1];
+if (document.readyState === 'loading') return false;
+const state = window.__pageState;
+if (!state) return document.readyState === 'complete';
+const now = Date.now();
+for (const started of state.pending.values()) {
+    if (now - started < longRequestMs) return false;
+}
+return (now - state.lastActivity) >= quietMs;
+"""
+
+
+class PageStateWaiter:
+    """Waits for the page to become idle instead of sleeping for a fixed time."""
+
+    SETTLE_TIMEOUT = float(os.getenv("PAGE_SETTLE_TIMEOUT", 5))
+    # Before a click the element wait still applies, so a page that does not settle quickly is not waited out.
+    PRE_CLICK_SETTLE_TIMEOUT = float(os.getenv("PAGE_PRE_CLICK_SETTLE_TIMEOUT", 1))
+    QUIET_MS = int(os.getenv("PAGE_QUIET_MS", 300))
+    LONG_REQUEST_MS = int(os.getenv("PAGE_LONG_REQUEST_MS", 2000))
+    POLL_FREQUENCY = 0.1
+
+    def __init__(self, driver_manager):
+        self.driver_manager = driver_manager
+        self.driver = driver_manager.driver
+        # Called on every poll so errors detected elsewhere (e.g. in the console) end the wait early.
+        self.error_check = None
+
+    def install(self):
+        """Register the tracker script; must run before the first navigation."""
+        self.driver_manager.add_script_on_new_document(PAGE_STATE_SCRIPT)
+
+    def wait_until_settled(self, timeout=None, quiet_ms=None):
+        """
+        Block until no network requests are in flight and the DOM has been quiet for quiet_ms.
+
+        :return: True if the page settled, False if the timeout elapsed first. A page that
+                 never settles (e.g. long polling) is not an error; the caller's element wait
+                 still applies afterwards.
+        """
+        timeout = self.SETTLE_TIMEOUT if timeout is None else timeout
+        quiet_ms = self.QUIET_MS if quiet_ms is None else quiet_ms
+
+        def settled(driver):
+            if self.error_check:
+                self.error_check()
+            return driver.execute_script(PAGE_SETTLED_CHECK, quiet_ms, self.LONG_REQUEST_MS)
+
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=self.POLL_FREQUENCY).until(settled)
+            return True
+        except TimeoutException:
+            logging.debug(f"Page did not settle within {timeout} seconds.")
+            return False
+        except WebDriverException as e:
+            logging.debug(f"Could not evaluate page state: {e}")
+            return False
+
+    def wait_before_click(self):
+        """Give the page a short chance to settle before clicking; the caller's element wait does the rest."""
+        return self.wait_until_settled(timeout=self.PRE_CLICK_SETTLE_TIMEOUT)
@@ -1,5 +1,8 @@
+import functools
+import logging
 import pika
 import threading
+import time
 
 
 class RabbitMQConnectionError(Exception):
@@ -9,7 +12,8 @@ class RabbitMQConnectionError(Exception):
 class RabbitMQManager:
     _instances = {}
 
-    def __new__(cls, host, port, queue_name, consumer_callback):
+    def __new__(cls, host, port, queue_name, consumer_callback, prefetch_count=1, retry_delays=(), issuer_queues=0,
+                on_connection_lost=None):
         if (host, port, queue_name) in cls._instances:
             return cls._instances[(host, port, queue_name)]
 
@@ -17,7 +21,16 @@ class RabbitMQManager:
         cls._instances[(host, port, queue_name)] = instance
         return instance
 
-    def __init__(self, host, port, queue_name, consumer_callback):
+    def __init__(self, host, port, queue_name, consumer_callback, prefetch_count=1, retry_delays=(), issuer_queues=0,
+                 on_connection_lost=None):
+        """
+        :param prefetch_count: Unacknowledged deliveries allowed across all consumed queues
+        :param retry_delays: Seconds a message waits before each retry; one TTL queue is declared per
+            delay, dead-lettering expired messages back onto queue_name
+        :param issuer_queues: Number of issuer queues ({queue_name}.issuer.N) the API spreads issuers
+            over; each is consumed alongside queue_name
+        :param on_connection_lost: Called with the error when the connection or channel closes while consuming
+        """
         if hasattr(self, 'initialized') and self.initialized:
             return
 
@@ -25,6 +38,10 @@ class RabbitMQManager:
         self.port = port
         self.queue_name = queue_name
         self.consumer_callback = consumer_callback
+        self.prefetch_count = prefetch_count
+        self.retry_delays = list(retry_delays)
+        self.issuer_queues = issuer_queues
+        self.on_connection_lost = on_connection_lost
         self.connection = None
         self.channel = None
         self.initialized = True
@@ -34,7 +51,21 @@ class RabbitMQManager:
         self.connection = pika.BlockingConnection(
             pika.ConnectionParameters(host=self.host, port=self.port, heartbeat=580))
         self.channel = self.connection.channel()
-        self.channel.queue_declare(queue=self.queue_name, durable=True)
+        for queue_name in self.queue_names():
+            self.channel.queue_declare(queue=queue_name, durable=True)
+        for delay in self.retry_delays:
+            self.channel.queue_declare(queue=self.retry_queue_name(delay), durable=True, arguments={
+                "x-message-ttl": int(delay * 1000),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": self.queue_name,
+            })
+
+    def queue_names(self):
+        """The main queue, which also receives retries, followed by every issuer queue."""
+        return [self.queue_name] + [f"{self.queue_name}.issuer.{shard}" for shard in range(self.issuer_queues)]
+
+    def retry_queue_name(self, delay):
+        return f"{self.queue_name}.retry.{delay}s"
 
     def close(self):
         if self.connection:
@@ -51,13 +82,55 @@ class RabbitMQManager:
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
     def consume(self):
-        self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(
-            queue=self.queue_name,
-            on_message_callback=self.consumer_callback,
-            auto_ack=False
-        )
-        self.channel.start_consuming()
+        # The prefetch limit is shared by every consumer on the channel, so no more deliveries are
+        # unacknowledged than can be worked on; a delivery left waiting behind others would outlive
+        # the broker's consumer_timeout and take the channel down. The broker hands freed deliveries
+        # to the consumers in turn, so a backlog in one queue does not starve the others.
+        self.channel.basic_qos(prefetch_count=self.prefetch_count, global_qos=True)
+        for queue_name in self.queue_names():
+            self.channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=self.consumer_callback,
+                auto_ack=False
+            )
+        try:
+            self.channel.start_consuming()
+        except pika.exceptions.AMQPError as e:
+            # Unacknowledged deliveries are requeued by the broker; their delivery tags are useless
+            # on any new channel, so recovering is left to the caller.
+            logging.error(f"Stopped consuming from RabbitMQ: {e!r}")
+            if self.on_connection_lost:
+                self.on_connection_lost(e)
+
+    def ack(self, delivery_tag):
+        """Acknowledge a message from any thread; pika channels are only safe on the connection thread."""
+        self.connection.add_callback_threadsafe(
+            functools.partial(self.channel.basic_ack, delivery_tag=delivery_tag))
+
+    def nack(self, delivery_tag, requeue=False):
+        """Reject a message from any thread."""
+        self.connection.add_callback_threadsafe(
+            functools.partial(self.channel.basic_nack, delivery_tag=delivery_tag, requeue=requeue))
+
+    def retry_later(self, delivery_tag, body, attempt):
+        """
+        Park a message in the retry queue for its attempt and acknowledge the original, from any thread.
+
+        :param attempt: Number of the upcoming retry, starting at 1; carried in the x-attempt header
+        """
+        delay = self.retry_delays[min(attempt, len(self.retry_delays)) - 1]
+        # The retry counts as enqueued once its delay is over, so the delay is not reported as issuer wait.
+        properties = pika.BasicProperties(
+            delivery_mode=2, headers={"x-attempt": attempt, "x-enqueued-at": time.time() + delay})
+
+        def publish_and_ack():
+            # Published before the ack, so a crash in between redelivers rather than loses the message.
+            self.channel.basic_publish(
+                exchange="", routing_key=self.retry_queue_name(delay), body=body, properties=properties)
+            self.channel.basic_ack(delivery_tag=delivery_tag)
+
+        self.connection.add_callback_threadsafe(publish_and_ack)
+        return delay
 
     def start(self):
         self.connect()
@@ -66,5 +139,5 @@ class RabbitMQManager:
         self._consumer_thread.start()
 
     def stop(self):
-        if self.connection:
+        if self.is_connected():
             self.connection.close()
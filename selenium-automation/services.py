@@ -1,24 +1,34 @@
 import httpx
 import os
 from typing import Dict
+from http_client import HttpClient
+
+
+class StatusUpdateFailureException(Exception):
+    """Raised when the AuthN API does not accept a status update."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
 
 
 class AzureAutoOBRClient:
     def __init__(self):
         self.api_key = os.environ.get('PASSKEY_OBR_API_KEY')
         self.base_url = os.environ.get('AUTHNAPI_URL')
+        # Optional endpoint accepting a list of status updates in one PATCH.
+        self.bulk_status_path = os.environ.get('AUTHNAPI_BULK_STATUS_PATH')
         self.headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key,
         }
+        self.http_client = HttpClient()
 
     def _send_request(self, method: str, url: str, params: Dict = None, data: Dict = None):
-        with httpx.Client() as client:
-            print(url)
-            response = client.request(
-                method, url, params=params, headers=self.headers, json=data
-            )
-            return response
+        print(url)
+        return self.http_client.request(
+            method, url, params=params, headers=self.headers, json=data
+        )
 
     def update_request_status(
         self, user_id: str, requestId: str, status: str, description: str
@@ -60,6 +70,38 @@ class AzureAutoOBRClient:
             # TODO: handle the exceptions
             print(f"Error sending request: {e}")
 
+    def send_request_status(self, user_id: str, requestId: str, status: str, description: str):
+        """
+        Send a single status update, raising StatusUpdateFailureException if it was not accepted.
+        Server errors and transport errors are retryable; other client errors are not.
+        """
+        url = f"{self.base_url}/internal/azureAutoOBR"
+        params = {"requestId": requestId, "userId": user_id}
+        data = {"status": status, "description": description}
+        self._raise_for_status(self._send_status_request("PATCH", url, params=params, data=data))
+
+    def send_request_statuses(self, updates):
+        """
+        Send several status updates in one request to the bulk endpoint.
+
+        :param updates: A list of dicts with userId, requestId, status and description
+        """
+        url = f"{self.base_url}{self.bulk_status_path}"
+        self._raise_for_status(self._send_status_request("PATCH", url, data=updates))
+
+    def _send_status_request(self, method, url, params=None, data=None):
+        try:
+            return self._send_request(method, url, params=params, data=data)
+        except httpx.HTTPError as e:
+            raise StatusUpdateFailureException(f"Error sending request: {e!r}")
+
+    def _raise_for_status(self, response):
+        if response.status_code == httpx.codes.OK:
+            return
+        raise StatusUpdateFailureException(
+            f"Request failed with status code {response.status_code}: {response.text}",
+            retryable=response.status_code >= 500 or response.status_code == httpx.codes.TOO_MANY_REQUESTS)
+
     # def notify_azure_auto_obr(self, azure_auto_obr_id: str):
     #     url = f"{self.base_url}/internal/notifyAzureAutoOBR"
     #     params = {"azureAutoOBRId": azure_auto_obr_id}
@@ -0,0 +1,140 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from services import StatusUpdateFailureException
+from metrics import STATUS_UPDATE, STATUS_UPDATE_OUTCOMES
+
+
+class StatusReporter:
+    """
+    Delivers status updates to the AuthN API from a background thread.
+
+    Updates are written to a SQLite outbox before the worker moves on, so they survive a crash and
+    are retried with exponential backoff until the API accepts them.
+    """
+
+    def __init__(self, client, db_path=None, batch_size=None, backoff=5, max_backoff=300, poll_interval=5):
+        self.client = client
+        self.db_path = db_path or os.getenv(
+            "STATUS_OUTBOX_PATH", "data/status_outbox.sqlite3")
+        self.batch_size = batch_size or int(os.getenv("STATUS_BATCH_SIZE", 50))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS status_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT,
+                    request_id TEXT,
+                    status TEXT NOT NULL,
+                    description TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL
+                )""")
+
+    def enqueue(self, user_id, request_id, status, description):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO status_outbox (user_id, request_id, status, description, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, request_id, status, description, time.time()))
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM status_outbox").fetchone()[0]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="status-reporter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            rows = self._due_rows()
+            if not rows:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                if self.client.bulk_status_path:
+                    with STATUS_UPDATE.time():
+                        self._deliver_bulk(rows)
+                else:
+                    for row in rows:
+                        with STATUS_UPDATE.time():
+                            self._deliver(row)
+            except Exception as e:
+                logging.error(f"Unexpected error delivering status updates: {e!r}")
+                self._failed(rows, StatusUpdateFailureException(str(e)))
+
+    def _due_rows(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, user_id, request_id, status, description, attempts FROM status_outbox "
+                "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size)).fetchall()
+
+    def _deliver(self, row):
+        row_id, user_id, request_id, status, description, attempts = row
+        try:
+            self.client.send_request_status(
+                user_id, request_id, status, description)
+        except StatusUpdateFailureException as e:
+            self._failed([row], e)
+            return
+        self._delivered([row_id])
+
+    def _deliver_bulk(self, rows):
+        updates = [{"userId": user_id, "requestId": request_id, "status": status, "description": description}
+                   for _, user_id, request_id, status, description, _ in rows]
+        try:
+            self.client.send_request_statuses(updates)
+        except StatusUpdateFailureException as e:
+            self._failed(rows, e)
+            return
+        self._delivered([row[0] for row in rows])
+
+    def _failed(self, rows, error):
+        STATUS_UPDATE_OUTCOMES.labels(outcome="error").inc(len(rows))
+        if not error.retryable:
+            logging.error(
+                f"Dropping {len(rows)} status update(s) rejected by the AuthN API: {error}")
+            self._delete([row[0] for row in rows])
+            return
+        logging.warning(
+            f"Failed to deliver {len(rows)} status update(s), will retry: {error}")
+        with self._lock, self._db:
+            for row in rows:
+                attempts = row[5] + 1
+                delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                self._db.execute(
+                    "UPDATE status_outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                    (attempts, time.time() + delay, row[0]))
+
+    def _delivered(self, row_ids):
+        STATUS_UPDATE_OUTCOMES.labels(outcome="ok").inc(len(row_ids))
+        self._delete(row_ids)
+
+    def _delete(self, row_ids):
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM status_outbox WHERE id = ?", [(row_id,) for row_id in row_ids])
@@ -1,5 +1,7 @@
 import httpx
 from logger import LoggerManager
+from http_client import HttpClient
+from metrics import TAP_FETCH, TAP_FETCH_OUTCOMES
 from dotenv import load_dotenv
 import os
 
@@ -18,6 +20,7 @@ class TAPManager:
     def __init__(self):
         self.logger = LoggerManager.setup_logger("TAP")
         self.base_url = os.getenv("AUTHNAPI_URL")
+        self.http_client = HttpClient()
         self.headers = {
             "Content-Type": "application/json",
             "x-api-key": os.getenv("PASSKEY_OBR_API_KEY", ""),
@@ -31,6 +34,16 @@ class TAPManager:
         :param obr_request_issuer: OBR request issuer ID
         :return: Temporary Access Pass or raises an exception if not found
         """
+        with TAP_FETCH.time():
+            try:
+                tap = self._retrieve_TAP(user_id, obr_request_issuer)
+            except TAPRetrievalFailureException:
+                TAP_FETCH_OUTCOMES.labels(outcome="error").inc()
+                raise
+        TAP_FETCH_OUTCOMES.labels(outcome="ok").inc()
+        return tap
+
+    def _retrieve_TAP(self, user_id: str, obr_request_issuer: str) -> str:
         try:
             endpoint = f"/internal/tap/{user_id}/{obr_request_issuer}"
             response = self._make_request("GET", endpoint)
@@ -63,22 +76,21 @@ class TAPManager:
         """
         url = f"{self.base_url}{endpoint}"
         try:
-            with httpx.Client() as client:
-                response = client.request(
-                    method, url, headers=self.headers, **kwargs)
+            response = self.http_client.request(
+                method, url, headers=self.headers, **kwargs)
 
-                if response.status_code == httpx.codes.OK:
-                    self.logger.debug(f"Request to {url} was successful.")
-                    return response.json()
+            if response.status_code == httpx.codes.OK:
+                self.logger.debug(f"Request to {url} was successful.")
+                return response.json()
+            else:
+                self.logger.error(
+                    f"Request to {url} failed with status code: {response.status_code}")
+                self.logger.error(f"Error: {response.text}")
+                if (response.json().get("message", None)):
+                    raise TAPRetrievalFailureException(
+                        response.json().get("message"))
                 else:
-                    self.logger.error(
-                        f"Request to {url} failed with status code: {response.status_code}")
-                    self.logger.error(f"Error: {response.text}")
-                    if (response.json().get("message", None)):
-                        raise TAPRetrievalFailureException(
-                            response.json().get("message"))
-                    else:
-                        raise TAPRetrievalFailureException(
-                            "Failed to retrieve TAP due to error from Microsoft.")
+                    raise TAPRetrievalFailureException(
+                        "Failed to retrieve TAP due to error from Microsoft.")
         except Exception as e:
             raise
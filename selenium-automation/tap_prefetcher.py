@@ -0,0 +1,58 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tap import TAPManager, TAPRetrievalFailureException
+
+
+class PrefetchedTAP:
+    """A Temporary Access Pass fetched ahead of browser work."""
+
+    MAX_AGE = float(os.getenv("TAP_MAX_AGE", 600))
+
+    def __init__(self, value):
+        self.value = value
+        self.fetched_at = time.monotonic()
+        self.consumed = False
+
+    def is_usable(self):
+        """A TAP is handed to the browser once, and only while it is younger than TAP_MAX_AGE."""
+        return not self.consumed and time.monotonic() - self.fetched_at < self.MAX_AGE
+
+    def consume(self):
+        self.consumed = True
+        return self.value
+
+
+class TAPPrefetcher:
+    """Fetches TAPs concurrently as messages arrive so browsers only ever see users with a valid TAP."""
+
+    def __init__(self, concurrency=4):
+        self.tap_manager = TAPManager()
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="tap-prefetch")
+
+    def submit(self, message, on_ready, on_failure):
+        """
+        Fetch the TAP for a message in the background.
+
+        :param on_ready: Called with (message, PrefetchedTAP) once the TAP is retrieved
+        :param on_failure: Called with (message, TAPRetrievalFailureException) if retrieval fails
+        """
+        self.executor.submit(self._fetch, message, on_ready, on_failure)
+
+    def _fetch(self, message, on_ready, on_failure):
+        try:
+            tap = self.tap_manager.retrieve_TAP(
+                message.get("userId"), message.get("issuerId"))
+        except TAPRetrievalFailureException as ex:
+            on_failure(message, ex)
+            return
+        except Exception as ex:
+            logging.error(f"Unexpected error prefetching TAP: {ex}")
+            on_failure(message, TAPRetrievalFailureException(ex))
+            return
+        on_ready(message, PrefetchedTAP(tap))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -1,7 +1,14 @@
-import json
 import hug
 from rabbitmq_manager import RabbitMQConnectionError
-from app import rabbitmq_manager
+from app import rabbitmq_manager, dedup_index, job_store
+import metrics
+from metrics import PROVISIONING_REQUESTS, PUBLISH_DURATION, record_enqueue
+from provisioning import (validate_provisioning_request, build_user_messages, summarize_enqueue,
+                          claimed_messages, merge_publish_errors, failed_user_ids, claimed_jobs, enqueue_failures,
+                          abandoned_publish_errors)
+
+ENQUEUE_STATUS = {"ok": hug.HTTP_200,
+                  "partial": hug.HTTP_207, "failed": hug.HTTP_500}
 
 
 def rabbitmq_connected(func):
@@ -27,41 +34,45 @@ def handle_rabbitmq_connection_error(exception, response):
 @hug.post("/automatic-user-provisioning")
 def auto_user_provisioning_with_email(body: hug.types.json, response):
     try:
-        issuer_id = body.get("issuer")
-        users = body.get("users")
-        request_id = body.get("requestId")
-
-        if not request_id:
+        error = validate_provisioning_request(body)
+        if error:
+            PROVISIONING_REQUESTS.labels(outcome="invalid").inc()
             response.status = hug.HTTP_400
-            return {"error": "Missing 'requestId' in the request."}
+            return {"error": error}
+
+        users = body["users"]
+        # Users already queued or provisioned for this request are reported as duplicates, not published again.
+        claimed = dedup_index.claim(body["requestId"], [user["uid"] for user in users])
+        try:
+            messages = claimed_messages(build_user_messages(body), claimed)
+            job_store.record_enqueue(body["requestId"], body["issuer"], claimed_jobs(users, claimed))
+            with PUBLISH_DURATION.time():
+                errors = rabbitmq_manager.publish_batch(
+                    messages, routing_key=rabbitmq_manager.issuer_queue_name(body["issuer"])) if messages else []
+            errors = merge_publish_errors(claimed, errors)
+        except Exception as e:
+            # Nothing reached the queue; the claims must not turn the client's retry into duplicates.
+            errors = abandoned_publish_errors(claimed, f"Failed to enqueue: {e!r}")
+        dedup_index.release(body["requestId"], failed_user_ids(users, errors))
+        job_store.record_enqueue_failures(body["requestId"], enqueue_failures(users, errors))
+        outcome, result = summarize_enqueue(users, errors)
+        record_enqueue(outcome, errors)
+        response.status = ENQUEUE_STATUS[outcome]
+        return result
+    except Exception as e:
+        response.status = hug.HTTP_500
+        return {"error": f"Internal Server Error: {str(e)}"}
 
-        if not issuer_id:
-            response.status = hug.HTTP_400
-            return {"error": "Missing 'issuer' in the request."}
 
-        if not users or not isinstance(users, list):
-            response.status = hug.HTTP_400
-            return {"error": "Invalid or empty 'users' field in the request."}
-
-        for user in users:
-            if not isinstance(user, dict) or "uid" not in user or "email" not in user:
-                response.status = hug.HTTP_400
-                return {"error": "Invalid user format in the 'users' field."}
-
-            user_data = {
-                "requestId": request_id,
-                "userId": user["uid"],
-                "email": user["email"],
-                "issuerId": issuer_id
-            }
-
-            message_body = json.dumps(user_data)
-            rabbitmq_manager.channel.basic_publish(
-                exchange='', routing_key=rabbitmq_manager.queue_name, body=message_body
-            )
-
-        response.status = hug.HTTP_200
-        return {"message": "User data added to RabbitMQ for processing"}
+@hug.get("/requests/{request_id}")
+def get_request_progress(request_id: hug.types.text, response):
+    # Answered from the job store, so it works while RabbitMQ is unreachable.
+    try:
+        progress = job_store.request_progress(request_id)
+        if progress is None:
+            response.status = hug.HTTP_404
+            return {"error": f"Unknown requestId '{request_id}'."}
+        return progress
     except Exception as e:
         response.status = hug.HTTP_500
         return {"error": f"Internal Server Error: {str(e)}"}
@@ -71,10 +82,7 @@ def auto_user_provisioning_with_email(body: hug.types.json, response):
 @hug.get("/queue-status")
 def get_queue_status(response):
     try:
-        queue_info = rabbitmq_manager.channel.queue_declare(
-            queue=rabbitmq_manager.queue_name, durable=True
-        )
-        message_count = queue_info.method.message_count
+        message_count = rabbitmq_manager.message_count()
 
         return {"queue_status": "OK", "message_count": message_count}
     except Exception as e:
@@ -82,6 +90,12 @@ def get_queue_status(response):
         return {"queue_status": "Error", "error_message": str(e)}
 
 
+@hug.get("/metrics", output=hug.output_format.text)
+def get_metrics():
+    body, _ = metrics.render()
+    return body.decode()
+
+
 @rabbitmq_connected
 @hug.patch("/azureAutoOBR")
 def update_request_status_api(body: hug.types.json, response):
@@ -3,6 +3,8 @@ import time
 import hug
 import os
 from rabbitmq_manager import RabbitMQManager, RabbitMQConnectionError
+from dedup_index import DedupIndex
+from job_store import JobStore
 
 
 # Read the HOSTNAME environment variable to get the hostname
@@ -10,6 +12,10 @@ hostname = os.environ.get('RABBITMQ_HOSTNAME', 'localhost')
 
 rabbitmq_manager = RabbitMQManager(hostname, 5672, 'obr')
 
+dedup_index = DedupIndex()
+
+job_store = JobStore()
+
 api = hug.API(__name__)
 
 
@@ -44,5 +50,9 @@ def close_rabbitmq_connection():
 atexit.register(close_rabbitmq_connection)
 
 if __name__ == '__main__':
-    init()
-    api.http.serve(port=8080)
+    if os.environ.get('SERVER_MODE', 'hug') == 'async':
+        import uvicorn
+        uvicorn.run("asgi_app:app", host="0.0.0.0", port=8080)
+    else:
+        init()
+        api.http.serve(port=8080)
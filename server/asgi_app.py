@@ -0,0 +1,167 @@
+"""
+ASGI application serving the provisioning API on asyncio.
+
+Handlers mirror api_handlers.py and share its validation through provisioning.py, but talk to
+RabbitMQ through AsyncRabbitMQManager so concurrent requests never wait on each other.
+Run with: SERVER_MODE=async python app.py  (or: uvicorn asgi_app:app --port 8080)
+"""
+import asyncio
+import json
+import os
+from async_rabbitmq_manager import AsyncRabbitMQManager
+from dedup_index import DedupIndex
+from job_store import JobStore
+import metrics
+from metrics import PROVISIONING_REQUESTS, PUBLISH_DURATION, record_enqueue
+from provisioning import (validate_provisioning_request, build_user_messages, summarize_enqueue,
+                          claimed_messages, merge_publish_errors, failed_user_ids, claimed_jobs, enqueue_failures,
+                          abandoned_publish_errors)
+
+ENQUEUE_STATUS = {"ok": 200, "partial": 207, "failed": 500}
+
+hostname = os.environ.get('RABBITMQ_HOSTNAME', 'localhost')
+
+rabbitmq_manager = AsyncRabbitMQManager(hostname, 5672, 'obr')
+
+dedup_index = DedupIndex()
+
+job_store = JobStore()
+
+
+async def _run_blocking(func, *args):
+    # SQLite calls run on the default thread pool so they never stall other requests.
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+async def auto_user_provisioning_with_email(body):
+    error = validate_provisioning_request(body)
+    if error:
+        PROVISIONING_REQUESTS.labels(outcome="invalid").inc()
+        return 400, {"error": error}
+
+    users = body["users"]
+    # Users already queued or provisioned for this request are reported as duplicates, not published again.
+    claimed = await _run_blocking(dedup_index.claim, body["requestId"], [user["uid"] for user in users])
+    try:
+        messages = claimed_messages(build_user_messages(body), claimed)
+        await _run_blocking(job_store.record_enqueue, body["requestId"], body["issuer"], claimed_jobs(users, claimed))
+        with PUBLISH_DURATION.time():
+            errors = await rabbitmq_manager.publish_batch(
+                messages, routing_key=rabbitmq_manager.issuer_queue_name(body["issuer"])) if messages else []
+        errors = merge_publish_errors(claimed, errors)
+    except Exception as e:
+        # Nothing reached the queue; the claims must not turn the client's retry into duplicates.
+        errors = abandoned_publish_errors(claimed, f"Failed to enqueue: {e!r}")
+    await _run_blocking(dedup_index.release, body["requestId"], failed_user_ids(users, errors))
+    await _run_blocking(job_store.record_enqueue_failures, body["requestId"], enqueue_failures(users, errors))
+    outcome, result = summarize_enqueue(users, errors)
+    record_enqueue(outcome, errors)
+    return ENQUEUE_STATUS[outcome], result
+
+
+async def get_queue_status(body):
+    try:
+        message_count = await rabbitmq_manager.message_count()
+        return 200, {"queue_status": "OK", "message_count": message_count}
+    except Exception as e:
+        return 500, {"queue_status": "Error", "error_message": str(e)}
+
+
+async def get_request_progress(request_id):
+    progress = await _run_blocking(job_store.request_progress, request_id)
+    if progress is None:
+        return 404, {"error": f"Unknown requestId '{request_id}'."}
+    return 200, progress
+
+
+async def update_request_status_api(body):
+    # This is only implemented for internal test environment and should not be used in production.
+    status = body.get("status") or ""
+    return (400 if status.lower() == "failed" else 200), {"message": body.get("description")}
+
+
+ROUTES = {
+    ("POST", "/automatic-user-provisioning"): auto_user_provisioning_with_email,
+    ("GET", "/queue-status"): get_queue_status,
+    ("PATCH", "/azureAutoOBR"): update_request_status_api,
+}
+
+# Routes ending in a path parameter, answered from local state without RabbitMQ.
+PARAMETER_ROUTES = {
+    ("GET", "/requests/"): get_request_progress,
+}
+
+
+async def _read_json(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    raw = b"".join(chunks)
+    return json.loads(raw) if raw else {}
+
+
+async def _send_json(send, status, payload):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await rabbitmq_manager.connect()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await rabbitmq_manager.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if (scope["method"], scope["path"]) == ("GET", "/metrics"):
+        body, content_type = metrics.render()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", content_type.encode())]})
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    for (method, prefix), parameter_handler in PARAMETER_ROUTES.items():
+        parameter = scope["path"][len(prefix):]
+        if scope["method"] == method and scope["path"].startswith(prefix) and parameter and "/" not in parameter:
+            try:
+                status, payload = await parameter_handler(parameter)
+            except Exception as e:
+                status, payload = 500, {"error": f"Internal Server Error: {str(e)}"}
+            await _send_json(send, status, payload)
+            return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        await _send_json(send, 404, {"error": "Not Found"})
+        return
+    if not rabbitmq_manager.is_connected():
+        await _send_json(send, 500, {"error": "Failed to connect to RabbitMQ. Please check the RabbitMQ server."})
+        return
+
+    try:
+        body = await _read_json(receive) if scope["method"] != "GET" else {}
+    except ValueError:
+        await _send_json(send, 400, {"error": "Request body must be valid JSON."})
+        return
+    try:
+        status, payload = await handler(body)
+    except Exception as e:
+        status, payload = 500, {"error": f"Internal Server Error: {str(e)}"}
+    await _send_json(send, status, payload)
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+import zlib
+import aio_pika
+from aio_pika.pool import Pool
+from rabbitmq_manager import RabbitMQConnectionError
+
+
+class AsyncRabbitMQManager:
+    """asyncio counterpart of RabbitMQManager that hands out channels from a pool."""
+
+    def __init__(self, host, port, queue_name, pool_size=None, publish_window=None):
+        self.host = host
+        self.port = port
+        self.queue_name = queue_name
+        self.pool_size = pool_size or int(os.environ.get('AMQP_CHANNEL_POOL_SIZE', 10))
+        self.publish_window = publish_window or int(os.environ.get('PUBLISH_WINDOW', 500))
+        # Must match the worker's ISSUER_QUEUES, which consumes every one of these queues.
+        self.issuer_queues = int(os.environ.get('ISSUER_QUEUES', 16))
+        self.connection = None
+        self.channel_pool = None
+
+    async def _get_channel(self):
+        # Publisher confirms are enabled so every awaited publish has been accepted by the broker.
+        return await self.connection.channel(publisher_confirms=True)
+
+    async def connect(self):
+        try:
+            self.connection = await aio_pika.connect_robust(
+                host=self.host, port=self.port, heartbeat=30)
+        except (aio_pika.exceptions.AMQPConnectionError, OSError) as e:
+            raise RabbitMQConnectionError(str(e))
+        self.channel_pool = Pool(self._get_channel, max_size=self.pool_size)
+        async with self.channel_pool.acquire() as channel:
+            for queue_name in self.queue_names():
+                await channel.declare_queue(queue_name, durable=True)
+
+    async def close(self):
+        if self.channel_pool:
+            await self.channel_pool.close()
+        if self.connection:
+            await self.connection.close()
+
+    def is_connected(self):
+        return bool(self.connection and not self.connection.is_closed)
+
+    def issuer_queue_name(self, issuer_id):
+        """Queue for an issuer's users; issuers are spread over ISSUER_QUEUES queues by a stable hash."""
+        return f"{self.queue_name}.issuer.{zlib.crc32(str(issuer_id).encode()) % self.issuer_queues}"
+
+    def queue_names(self):
+        """The main queue, which also receives retries, followed by every issuer queue."""
+        return [self.queue_name] + [f"{self.queue_name}.issuer.{shard}" for shard in range(self.issuer_queues)]
+
+    async def publish_batch(self, bodies, routing_key=None):
+        """
+        Publish persistent messages with at most publish_window confirms outstanding.
+
+        :param routing_key: Queue to publish to, usually issuer_queue_name(); defaults to the main queue
+        :return: A list with one error string per body, None for bodies that were enqueued
+        """
+        routing_key = routing_key or self.queue_name
+        window = asyncio.Semaphore(self.publish_window)
+        # Workers report how long each issuer's users waited from this timestamp.
+        headers = {"x-enqueued-at": time.time()}
+
+        async def publish(channel, body):
+            async with window:
+                try:
+                    await channel.default_exchange.publish(
+                        aio_pika.Message(body=body.encode(),
+                                         delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                                         headers=headers),
+                        routing_key=routing_key)
+                    return None
+                except Exception as e:
+                    return f"Failed to enqueue: {e!r}"
+
+        try:
+            async with self.channel_pool.acquire() as channel:
+                return await asyncio.gather(*(publish(channel, body) for body in bodies))
+        except Exception as e:
+            # No channel could be acquired, so nothing was published.
+            return [f"Failed to enqueue: {e!r}"] * len(bodies)
+
+    async def message_count(self):
+        async with self.channel_pool.acquire() as channel:
+            total = 0
+            for queue_name in self.queue_names():
+                queue = await channel.declare_queue(queue_name, durable=True, passive=True)
+                total += queue.declaration_result.message_count
+            return total
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class DedupIndex:
+    """
+    (requestId, userId) pairs that are queued or provisioned, kept in SQLite shared by the API and the worker.
+
+    The API claims a pair before publishing it, so a request retried after a timeout does not enqueue
+    its users a second time; the worker marks a pair done once its security key is registered and
+    skips redeliveries of done pairs. Users that finally fail are released so a retried request
+    provisions them again. Entries expire after DEDUP_TTL seconds so a message lost with its queue
+    does not block a user forever.
+
+    This module is kept identical in server/ and selenium-automation/; both open the same file
+    (DEDUP_DB_PATH) on a shared volume.
+    """
+
+    QUEUED = "queued"
+    DONE = "done"
+
+    def __init__(self, db_path=None, ttl=None):
+        self.db_path = db_path or os.getenv("DEDUP_DB_PATH", "data/dedup.sqlite3")
+        self.ttl = ttl or float(os.getenv("DEDUP_TTL", 7 * 24 * 3600))
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The API and the worker write from separate processes; wait for the other's lock instead of failing.
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS dedup_index (
+                    request_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (request_id, user_id)
+                )""")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS dedup_index_updated_at ON dedup_index (updated_at)")
+
+    def claim(self, request_id, user_ids):
+        """
+        Claim users of a request for enqueueing.
+
+        :return: One bool per user id, True if it was claimed and False if it is a duplicate of a
+            pair already queued or done, or of an earlier user id in the same call
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM dedup_index WHERE updated_at < ?", (now - self.ttl,))
+            return [self._db.execute(
+                "INSERT OR IGNORE INTO dedup_index (request_id, user_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                (request_id, user_id, self.QUEUED, now)).rowcount == 1 for user_id in user_ids]
+
+    def release(self, request_id, user_ids):
+        """Forget users so a later request may enqueue them again."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM dedup_index WHERE request_id = ? AND user_id = ?",
+                [(request_id, user_id) for user_id in user_ids])
+
+    def mark_done(self, request_id, user_id):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO dedup_index (request_id, user_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                (request_id, user_id, self.DONE, time.time()))
+
+    def is_done(self, request_id, user_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM dedup_index WHERE request_id = ? AND user_id = ? AND state = ? AND updated_at >= ?",
+                (request_id, user_id, self.DONE, time.time() - self.ttl)).fetchone()
+        return row is not None
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class JobStore:
+    """
+    Progress of every user of every provisioning request, kept in SQLite shared by the API and the worker.
+
+    The API records users as enqueued before publishing them, so a worker never updates a row that
+    does not exist yet, and marks those it failed to publish; the worker moves them through
+    in_progress, retrying and finally done or failed. GET /requests/{requestId} is answered from
+    here without touching RabbitMQ.
+
+    This module is kept identical in server/ and selenium-automation/; both open the same file
+    (JOB_STORE_PATH) on a shared volume.
+    """
+
+    ENQUEUED = "enqueued"
+    IN_PROGRESS = "in_progress"
+    RETRYING = "retrying"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.getenv("JOB_STORE_PATH", "data/jobs.sqlite3")
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The API and the worker write from separate processes; wait for the other's lock instead of failing.
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    request_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    issuer_id TEXT,
+                    email TEXT,
+                    status TEXT NOT NULL,
+                    detail TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (request_id, user_id)
+                )""")
+            # The primary key serves lookups by request_id.
+            for column in ("user_id", "issuer_id", "status"):
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS jobs_{column} ON jobs ({column})")
+
+    def record_enqueue(self, request_id, issuer_id, users):
+        """
+        Record users of a request as enqueued, starting them over if they were recorded before.
+
+        :param users: (userId, email) tuples
+        """
+        now = time.time()
+        rows = [(request_id, user_id, issuer_id, email, self.ENQUEUED, None, now, now)
+                for user_id, email in users]
+        with self._lock, self._db:
+            self._db.executemany("""
+                INSERT INTO jobs (request_id, user_id, issuer_id, email, status, detail, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (request_id, user_id) DO UPDATE SET
+                    issuer_id = excluded.issuer_id, email = excluded.email, status = excluded.status,
+                    detail = excluded.detail, attempts = 0, updated_at = excluded.updated_at""", rows)
+
+    def record_enqueue_failures(self, request_id, failures):
+        """
+        Mark users whose messages could not be published as failed.
+
+        :param failures: (userId, error) tuples
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET status = ?, detail = ?, updated_at = ? WHERE request_id = ? AND user_id = ?",
+                [(self.FAILED, error, now, request_id, user_id) for user_id, error in failures])
+
+    def update(self, request_id, user_id, status, detail=None, attempts=None):
+        """Move a user to a new status; attempts is left unchanged when None."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, detail = ?, attempts = COALESCE(?, attempts), updated_at = ? "
+                "WHERE request_id = ? AND user_id = ?",
+                (status, detail, attempts, time.time(), request_id, user_id))
+
+    def request_progress(self, request_id):
+        """Return the progress of a request, or None if no user of it was recorded."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE request_id = ? ORDER BY created_at, user_id", (request_id,)).fetchall()
+        if not rows:
+            return None
+        counts = {}
+        for row in rows:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        return {
+            "requestId": request_id,
+            "issuerId": rows[0]["issuer_id"],
+            "total": len(rows),
+            "counts": counts,
+            "complete": all(row["status"] in (self.DONE, self.FAILED) for row in rows),
+            "users": [{
+                "userId": row["user_id"],
+                "email": row["email"],
+                "status": row["status"],
+                "detail": row["detail"],
+                "attempts": row["attempts"],
+                "updatedAt": row["updated_at"],
+            } for row in rows],
+        }
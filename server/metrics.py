@@ -0,0 +1,23 @@
+"""Prometheus metrics for the provisioning API, served on /metrics by both the hug and asyncio servers."""
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+PROVISIONING_REQUESTS = Counter(
+    "provisioning_requests_total", "Provisioning requests by outcome.", ["outcome"])
+USERS_ENQUEUED = Counter(
+    "provisioning_users_total", "Users in provisioning requests by enqueue result.", ["status"])
+PUBLISH_DURATION = Histogram(
+    "provisioning_publish_duration_seconds", "Time to publish all users of a provisioning request.")
+
+
+def record_enqueue(outcome, errors):
+    PROVISIONING_REQUESTS.labels(outcome=outcome).inc()
+    duplicates = sum(1 for error in errors if error == "duplicate")
+    failed = sum(1 for error in errors if error) - duplicates
+    USERS_ENQUEUED.labels(status="enqueued").inc(len(errors) - failed - duplicates)
+    USERS_ENQUEUED.labels(status="failed").inc(failed)
+    USERS_ENQUEUED.labels(status="duplicate").inc(duplicates)
+
+
+def render():
+    """Return the exposition body and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,114 @@
+"""Request validation and message building shared by the hug and asyncio servers."""
+import json
+
+# Worker browser backends a request may ask for; see DriverManager in the worker.
+BACKENDS = ("chrome", "lite")
+
+# Publish result of a user that is already queued or provisioned for the same request.
+DUPLICATE = "duplicate"
+
+
+def validate_provisioning_request(body):
+    """Validate the whole provisioning payload before anything is enqueued. Returns an error message or None."""
+    if not isinstance(body, dict):
+        return "Invalid request body."
+
+    if not body.get("requestId"):
+        return "Missing 'requestId' in the request."
+
+    if not body.get("issuer"):
+        return "Missing 'issuer' in the request."
+
+    users = body.get("users")
+    if not users or not isinstance(users, list):
+        return "Invalid or empty 'users' field in the request."
+
+    if "backend" in body and body["backend"] not in BACKENDS:
+        return f"Invalid 'backend' in the request, expected one of {', '.join(BACKENDS)}."
+
+    for index, user in enumerate(users):
+        if not isinstance(user, dict) or "uid" not in user or "email" not in user:
+            return f"Invalid user format in the 'users' field at index {index}."
+        if "backend" in user and user["backend"] not in BACKENDS:
+            return f"Invalid 'backend' in the 'users' field at index {index}."
+    return None
+
+
+def build_user_messages(body):
+    messages = []
+    for user in body["users"]:
+        message = {
+            "requestId": body["requestId"],
+            "userId": user["uid"],
+            "email": user["email"],
+            "issuerId": body["issuer"]
+        }
+        # A user-level backend overrides the request-level one; without either the worker uses its default.
+        backend = user.get("backend", body.get("backend"))
+        if backend:
+            message["backend"] = backend
+        messages.append(json.dumps(message))
+    return messages
+
+
+def claimed_messages(messages, claimed):
+    """The messages of the users claimed in the dedup index, in publish order."""
+    return [message for message, fresh in zip(messages, claimed) if fresh]
+
+
+def merge_publish_errors(claimed, errors):
+    """Spread the publish errors of the claimed users over all users, with DUPLICATE for the others."""
+    errors = iter(errors)
+    return [next(errors) if fresh else DUPLICATE for fresh in claimed]
+
+
+def abandoned_publish_errors(claimed, error):
+    """Publish errors for a batch that failed before it could be published: every claimed user gets `error`."""
+    return merge_publish_errors(claimed, [error] * sum(1 for fresh in claimed if fresh))
+
+
+def failed_user_ids(users, errors):
+    return [user_id for user_id, _ in enqueue_failures(users, errors)]
+
+
+def claimed_jobs(users, claimed):
+    """(userId, email) of every user claimed in the dedup index, for the job store."""
+    return [(user["uid"], user["email"]) for user, fresh in zip(users, claimed) if fresh]
+
+
+def enqueue_failures(users, errors):
+    """(userId, error) of every user that could not be published, for the job store."""
+    return [(user["uid"], error) for user, error in zip(users, errors) if error and error != DUPLICATE]
+
+
+def build_enqueue_results(users, errors):
+    results = []
+    for user, error in zip(users, errors):
+        if error == DUPLICATE:
+            results.append({"userId": user["uid"], "email": user["email"], "status": DUPLICATE})
+            continue
+        result = {"userId": user["uid"], "email": user["email"],
+                  "status": "failed" if error else "enqueued"}
+        if error:
+            result["error"] = error
+        results.append(result)
+    return results
+
+
+def summarize_enqueue(users, errors):
+    """Return the outcome ("ok", "partial" or "failed") and the response body for a publish attempt."""
+    duplicates = sum(1 for error in errors if error == DUPLICATE)
+    failed = sum(1 for error in errors if error) - duplicates
+    if not failed:
+        outcome, message = "ok", "User data added to RabbitMQ for processing"
+    elif failed == len(users):
+        outcome, message = "failed", "User data could not be added to RabbitMQ"
+    else:
+        outcome, message = "partial", "Some users could not be added to RabbitMQ"
+    return outcome, {
+        "message": message,
+        "enqueued": len(users) - failed - duplicates,
+        "duplicates": duplicates,
+        "failed": failed,
+        "results": build_enqueue_results(users, errors)
+    }
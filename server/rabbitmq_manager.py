@@ -1,6 +1,8 @@
+import os
 import pika
 import threading
 import time
+import zlib
 
 class RabbitMQConnectionError(Exception):
     pass
@@ -25,6 +27,10 @@ class RabbitMQManager:
         self.queue_name = queue_name
         self.connection = None
         self.channel = None
+        self.publish_channel = None
+        self.publish_batch_size = int(os.environ.get('PUBLISH_BATCH_SIZE', 500))
+        # Must match the worker's ISSUER_QUEUES, which consumes every one of these queues.
+        self.issuer_queues = int(os.environ.get('ISSUER_QUEUES', 16))
         self.initialized = True
         self.heartbeat_thread = None
         self.lock = threading.Lock()
@@ -49,12 +55,75 @@ class RabbitMQManager:
             self.connection = pika.BlockingConnection(
                 pika.ConnectionParameters(host=self.host, port=self.port, heartbeat=30))
             self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=self.queue_name, durable=True)
+            for queue_name in self.queue_names():
+                self.channel.queue_declare(queue=queue_name, durable=True)
+            # Bulk publishes use their own transactional channel so a whole batch is
+            # confirmed by the broker with a single commit round trip.
+            self.publish_channel = self.connection.channel()
+            self.publish_channel.tx_select()
             if self.heartbeat_thread is None:
                 self.heartbeat_thread = threading.Thread(target=self._send_heartbeat)
                 self.heartbeat_thread.daemon = True
                 self.heartbeat_thread.start()
 
+    def issuer_queue_name(self, issuer_id):
+        """Queue for an issuer's users; issuers are spread over ISSUER_QUEUES queues by a stable hash."""
+        return f"{self.queue_name}.issuer.{zlib.crc32(str(issuer_id).encode()) % self.issuer_queues}"
+
+    def queue_names(self):
+        """The main queue, which also receives retries, followed by every issuer queue."""
+        return [self.queue_name] + [f"{self.queue_name}.issuer.{shard}" for shard in range(self.issuer_queues)]
+
+    def message_count(self):
+        with self.lock:
+            return sum(self.channel.queue_declare(queue=queue_name, durable=True).method.message_count
+                       for queue_name in self.queue_names())
+
+    def publish_batch(self, bodies, batch_size=None, routing_key=None):
+        """
+        Publish persistent messages to the queue in batches, committing each batch at once.
+
+        :param bodies: Message bodies in publish order
+        :param batch_size: Messages per commit (in-flight window); defaults to PUBLISH_BATCH_SIZE
+        :param routing_key: Queue to publish to, usually issuer_queue_name(); defaults to the main queue
+        :return: A list with one error string per body, None for bodies that were enqueued
+        """
+        batch_size = batch_size or self.publish_batch_size
+        routing_key = routing_key or self.queue_name
+        errors = []
+        for start in range(0, len(bodies), batch_size):
+            batch = bodies[start:start + batch_size]
+            # Workers report how long each issuer's users waited from this timestamp.
+            properties = pika.BasicProperties(delivery_mode=2, headers={"x-enqueued-at": time.time()})
+            try:
+                with self.lock:
+                    for body in batch:
+                        self.publish_channel.basic_publish(
+                            exchange='', routing_key=routing_key, body=body, properties=properties)
+                    self.publish_channel.tx_commit()
+                errors.extend([None] * len(batch))
+            except (pika.exceptions.AMQPError, AttributeError) as e:
+                # AttributeError: there is no publish channel before connect() or while reconnecting.
+                error = f"Failed to enqueue: {e!r}"
+                errors.extend([error] * len(batch))
+                # Nothing from this batch was committed; later batches cannot succeed on a broken channel.
+                remaining = len(bodies) - start - len(batch)
+                errors.extend(["Not attempted after an earlier batch failed."] * remaining)
+                self._reopen_publish_channel()
+                break
+        return errors
+
+    def _reopen_publish_channel(self):
+        with self.lock:
+            try:
+                if self.publish_channel and self.publish_channel.is_open:
+                    self.publish_channel.close()
+                if self.connection and self.connection.is_open:
+                    self.publish_channel = self.connection.channel()
+                    self.publish_channel.tx_select()
+            except pika.exceptions.AMQPError:
+                pass
+
     def close(self):
         with self.lock:
             if self.connection: